@@ -1,10 +1,13 @@
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from pydantic import BaseModel, Field
 from schemas import Analyst, Perspective, GeneratAnalystState
+from scheduler import Scheduler
+from models import ModelRouter, as_router
 
 load_dotenv()
 
@@ -23,19 +26,23 @@ ANALYST_INSTRUCTIONS ="""You are tasked with creating a set of AI analyst person
 """
 
 class AnalystAgent:
-    def __init__(self, llm: ChatOpenAI):
+    def __init__(self, llm: ChatOpenAI | ModelRouter, scheduler: Scheduler | None = None, checkpointer: BaseCheckpointSaver | None = None):
         self.llm = llm
+        self.models = as_router(llm)
+        self.scheduler = scheduler or Scheduler("llm")
+        self.checkpointer = checkpointer or MemorySaver()
         self.graph = self._build_graph()
 
     def _build_graph(self):
-        def create_analyst(state: GeneratAnalystState):
+        structured_llm = self.models.structured("create_analysts", Perspective)
+
+        async def create_analyst(state: GeneratAnalystState):
             """Create analysts"""
             topic = state.topic
             max_analysts = state.max_analysts
             human_analyst_feedback = state.human_analyst_feedback
-            structured_llm = self.llm.with_structured_output(Perspective)
             system_message = SystemMessage(content=ANALYST_INSTRUCTIONS.format(topic=topic, max_analysts=max_analysts, human_analyst_feedback=human_analyst_feedback))
-            response = structured_llm.invoke([system_message, HumanMessage(content="Generate the analysts")])
+            response = await self.scheduler.ainvoke(structured_llm, [system_message, HumanMessage(content="Generate the analysts")])
             analysts = response.analysts
             print("-" * 50)
             for analyst in analysts:
@@ -43,7 +50,7 @@ class AnalystAgent:
                 print("-" * 50)
             return {"analysts": analysts}
 
-        def human_feedback(state: GeneratAnalystState):
+        async def human_feedback(state: GeneratAnalystState):
             """No-op node that will be interrupted by a human"""
             pass
 
@@ -66,6 +73,5 @@ class AnalystAgent:
                 should_continue,
                 ["create_analysts", END]
             )
-            memory = MemorySaver()
-            return builder.compile(checkpointer=memory, interrupt_before=['human_feedback'])
+            return builder.compile(checkpointer=self.checkpointer, interrupt_before=['human_feedback'])
         return build_create_analyst_graph()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+from langchain_openai import ChatOpenAI
+from cache import LLMCache, RetrievalCache
+from scheduler import Scheduler
+from research import MAX_CONCURRENCY
+from models import ModelRouter
+from main import (
+    build_llm,
+    run_analyst_agent,
+    conduct_research,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    SEARCH_REQUESTS_PER_MINUTE,
+)
+
+DEFAULT_MAX_ANALYSTS = 3
+DEFAULT_MAX_NUM_TURNS = 2
+DEFAULT_WORKERS = 2
+
+
+def slugify(text: str, max_length: int = 60) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", text.casefold()).strip("-")
+    return slug[:max_length].rstrip("-") or "topic"
+
+
+def read_topics(path: str) -> list[dict]:
+    """Read one job per line: {"topic": ..., "max_analysts"?, "max_num_turns"?, "feedback"?}
+
+    A line that is not a valid job becomes {"line": ..., "error": ...}, so it is reported
+    as a failed topic instead of stopping the batch.
+    """
+    jobs = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+                if not isinstance(job, dict) or not job.get("topic"):
+                    raise ValueError("missing topic")
+            except ValueError as e:
+                jobs.append({"line": line_number, "error": f"{path}:{line_number}: {e}"})
+                continue
+            feedback = job.get("feedback")
+            if isinstance(feedback, str):
+                job["feedback"] = [feedback]
+            jobs.append(job)
+    return jobs
+
+
+def record_invalid(index: int, job: dict, args: argparse.Namespace) -> dict:
+    """Write the metadata of a line that could not be read as a job"""
+    name = f"{index:03d}-line-{job['line']}"
+    metadata = {"topic": None, "line": job["line"], "status": "failed", "error": job["error"], "duration_s": 0.0}
+    with open(os.path.join(args.output_dir, f"{name}.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    print(f"[{name}] failed: {job['error']}")
+    return metadata
+
+
+async def run_topic(
+    index: int,
+    job: dict,
+    args: argparse.Namespace,
+    llm: ChatOpenAI | ModelRouter,
+    retrieval_cache: RetrievalCache,
+    llm_scheduler: Scheduler,
+    search_scheduler: Scheduler,
+) -> dict:
+    """Research one topic and write `<name>.md` and `<name>.json` to the output directory"""
+    name = f"{index:03d}-{slugify(job['topic'])}"
+    thread_id = f"{name}-{uuid.uuid4().hex[:8]}"
+    report_path = os.path.join(args.output_dir, f"{name}.md")
+    metadata = {
+        "topic": job["topic"],
+        "thread_id": thread_id,
+        "max_analysts": job.get("max_analysts", args.max_analysts),
+        "max_num_turns": job.get("max_num_turns", args.max_num_turns),
+        "feedback": job.get("feedback", []),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+    }
+    started = time.monotonic()
+    print(f"[{name}] started")
+    try:
+        analysts, topic = await run_analyst_agent(
+            llm,
+            job["topic"],
+            metadata["max_analysts"],
+            llm_scheduler,
+            feedback=metadata["feedback"],
+            thread_id=thread_id,
+            verbose=False,
+        )
+        metadata["analysts"] = [analyst.model_dump() for analyst in analysts]
+        final_report = await conduct_research(
+            llm,
+            analysts,
+            topic,
+            metadata["max_num_turns"],
+            retrieval_cache,
+            max_concurrency=args.max_concurrency,
+            llm_scheduler=llm_scheduler,
+            search_scheduler=search_scheduler,
+            output_path=report_path,
+            thread_id=thread_id,
+            verbose=False,
+        )
+        if not final_report:
+            raise RuntimeError("the research graph finished without a report")
+        metadata["status"] = "completed"
+        metadata["report_path"] = report_path
+    except Exception as e:
+        metadata["status"] = "failed"
+        metadata["error"] = f"{type(e).__name__}: {e}"
+        metadata["traceback"] = traceback.format_exc()
+    metadata["duration_s"] = round(time.monotonic() - started, 3)
+    with open(os.path.join(args.output_dir, f"{name}.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    print(f"[{name}] {metadata['status']} in {metadata['duration_s']}s")
+    return metadata
+
+
+async def run_batch(args: argparse.Namespace) -> list[dict]:
+    jobs = read_topics(args.topics)
+    os.makedirs(args.output_dir, exist_ok=True)
+    llm_cache = LLMCache()
+    llm = build_llm(llm_cache, args.models)
+    retrieval_cache = RetrievalCache()
+    llm_scheduler = Scheduler("llm", LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+    search_scheduler = Scheduler("search", SEARCH_REQUESTS_PER_MINUTE)
+    workers = asyncio.Semaphore(args.workers)
+
+    async def worker(index: int, job: dict) -> dict:
+        if "error" in job:
+            return record_invalid(index, job, args)
+        async with workers:
+            return await run_topic(index, job, args, llm, retrieval_cache, llm_scheduler, search_scheduler)
+
+    results = await asyncio.gather(*[worker(index, job) for index, job in enumerate(jobs, 1)])
+    failed = [result for result in results if result["status"] != "completed"]
+    print(f"{len(results) - len(failed)}/{len(results)} topics completed")
+    for result in failed:
+        label = result["topic"] or f"line {result['line']}"
+        print(f"FAILED: {label}: {result['error']}")
+    print(f"LLM cache: {llm_cache.stats()}")
+    print(f"Retrieval cache: {retrieval_cache.stats()}")
+    print(f"LLM scheduler: {llm_scheduler.stats()}")
+    print(f"Search scheduler: {search_scheduler.stats()}")
+    return results
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Research every topic in a JSONL file without prompting.")
+    parser.add_argument("topics", help="JSONL file with one {\"topic\": ...} object per line.")
+    parser.add_argument("--output-dir", default="reports", help="Directory for the reports and their metadata.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Topics researched at the same time.")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY, help="Interviews run at once per topic.")
+    parser.add_argument("--max-analysts", type=int, default=DEFAULT_MAX_ANALYSTS, help="Default analysts per topic.")
+    parser.add_argument("--max-num-turns", type=int, default=DEFAULT_MAX_NUM_TURNS, help="Default interview turns.")
+    parser.add_argument("--models", help="JSON file routing graph nodes to models (see README).")
+    return parser.parse_args(argv)
+
+
+def main():
+    results = asyncio.run(run_batch(parse_args()))
+    if any(result["status"] != "completed" for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from cache import RetrievalCache
+from checkpoints import open_checkpointer
+from documents import DOCUMENT_ID_PATTERN, SourceDocument
+from main import run_analyst_agent
+from research import ResearchAgent
+from retrievers import Retriever, MAX_RESULTS
+from scheduler import CHARS_PER_TOKEN
+from schemas import Analyst, Perspective, ResearchState, SearchQueries
+from tracing import Tracer
+
+TOPIC = "The economics of grid-scale battery storage"
+DEFAULT_BASELINE_PATH = "benchmark_baseline.json"
+# A metric is flagged when it exceeds its baseline by more than this fraction.
+DEFAULT_TOLERANCE = 0.15
+WATCHED_METRICS = ("wall_s", "peak_rss_mb", "checkpoint_kb", "llm_calls")
+
+VOCABULARY = (
+    "battery grid storage capacity lithium cost market price demand supply peak load solar wind "
+    "utility revenue arbitrage frequency reserve inverter cycle degradation warranty project finance "
+    "tariff policy subsidy interconnection transmission forecast dispatch megawatt hour efficiency"
+).split()
+CITATIONS_PER_RESPONSE = 3
+QUERIES_PER_PLAN = 2
+
+
+def _rng(*parts: str) -> random.Random:
+    return random.Random(hashlib.sha256("\x00".join(parts).encode("utf-8")).digest())
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline chat model with a fixed latency and response size.
+
+    Responses are pseudo-random words seeded by the prompt, followed by citations of
+    the first documents in the prompt so the citation pipeline is exercised. Usage is
+    reported like the real model's, so the tracer and scheduler see realistic tokens.
+    """
+
+    latency: float = 0.05
+    completion_tokens: int = 200
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _respond(self, messages: list[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        ids = list(dict.fromkeys(DOCUMENT_ID_PATTERN.findall(prompt)))[:CITATIONS_PER_RESPONSE]
+        text = _words(_rng(prompt), self.completion_tokens)
+        if ids:
+            text += " " + " ".join(f"[{id}]" for id in ids)
+        usage = {
+            "input_tokens": len(prompt) // CHARS_PER_TOKEN,
+            "output_tokens": self.completion_tokens,
+            "total_tokens": len(prompt) // CHARS_PER_TOKEN + self.completion_tokens,
+        }
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+    def with_structured_output(self, schema, **kwargs):
+        async def respond(messages: list[BaseMessage]):
+            message = await self.ainvoke(messages)
+            return structured_response(schema, messages, message.content)
+        return RunnableLambda(respond)
+
+
+def structured_response(schema, messages: list[BaseMessage], text: str):
+    """Build the schemas the graphs ask for from a fake response"""
+    rng = _rng(text)
+    if schema is Perspective:
+        match = re.search(r"Pick the top (\d+) themes", messages[0].content)
+        count = int(match.group(1)) if match else 1
+        return Perspective(analysts=[
+            Analyst(affiliation=_words(rng, 2), name=f"Analyst {i + 1}", role=_words(rng, 3), description=_words(rng, 20))
+            for i in range(count)
+        ])
+    if schema is SearchQueries:
+        return SearchQueries(search_queries=[_words(rng, 4) for _ in range(QUERIES_PER_PLAN)])
+    raise ValueError(f"No fake response for {schema.__name__}")
+
+
+class FakeRetriever(Retriever):
+    """Deterministic offline retriever with a fixed latency and document size"""
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.1, document_chars: int = 2000, max_results: int = MAX_RESULTS):
+        super().__init__(max_results=max_results)
+        self.latency = latency
+        self.document_chars = document_chars
+
+    async def afetch(self, query: str) -> list[dict]:
+        await asyncio.sleep(self.latency)
+        docs = []
+        for i in range(self.max_results):
+            rng = _rng(query, str(i))
+            content = _words(rng, self.document_chars // 7)[:self.document_chars]
+            docs.append({"url": f"https://example.com/{rng.getrandbits(32):08x}", "content": content})
+        return docs
+
+    def to_document(self, doc: dict) -> SourceDocument:
+        return SourceDocument(source=doc["url"], content=doc["content"], is_link=True)
+
+
+async def run_benchmark(
+    max_analysts: int,
+    max_num_turns: int,
+    concurrency: int,
+    llm_latency: float,
+    search_latency: float,
+    completion_tokens: int,
+    document_chars: int,
+) -> dict:
+    """Run analyst generation and research once against the fakes and measure it"""
+    llm = FakeChatModel(latency=llm_latency, completion_tokens=completion_tokens)
+    retrievers = [FakeRetriever(search_latency, document_chars)]
+    tracer = Tracer()
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint_path = os.path.join(directory, "checkpoints.sqlite")
+        started = time.perf_counter()
+        async with open_checkpointer(checkpoint_path) as checkpointer:
+            analysts, topic = await run_analyst_agent(
+                llm, TOPIC, max_analysts, feedback=[], thread_id="analysts", verbose=False, checkpointer=checkpointer, tracer=tracer
+            )
+            agent = ResearchAgent(
+                llm,
+                max_num_turns,
+                RetrievalCache(":memory:"),
+                concurrency,
+                checkpointer=checkpointer,
+                retrievers=retrievers,
+            )
+            config = {"configurable": {"thread_id": "research"}, "callbacks": [tracer]}
+            async for _ in agent.graph.astream(ResearchState(analysts=analysts, topic=topic), config, stream_mode="updates"):
+                pass
+            final_report = (await agent.graph.aget_state(config)).values.get("final_report")
+        wall = time.perf_counter() - started
+        checkpoint_bytes = os.path.getsize(checkpoint_path)
+    if not final_report:
+        raise RuntimeError("the research graph finished without a report")
+    return {
+        "wall_s": round(wall, 3),
+        "checkpoint_kb": round(checkpoint_bytes / 1024, 1),
+        "llm_calls": sum(stats["llm_calls"] for stats in tracer.nodes.values()),
+        "calls": {node: stats["calls"] for node, stats in sorted(tracer.nodes.items())},
+    }
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere.
+    return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+def measure(settings: dict) -> dict:
+    """Benchmark entry point for a fresh worker process, so peak RSS is per configuration"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = asyncio.run(run_benchmark(**settings))
+    return {**result, "peak_rss_mb": _peak_rss_mb()}
+
+
+def config_key(max_analysts: int, max_num_turns: int, concurrency: int) -> str:
+    return f"a{max_analysts}-t{max_num_turns}-c{concurrency}"
+
+
+def find_regressions(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in WATCHED_METRICS:
+            before, after = baseline[key].get(metric), result[metric]
+            if before is None:
+                continue
+            # Call counts are deterministic, so any increase is a regression.
+            limit = before if metric == "llm_calls" else before * (1 + tolerance)
+            if after > limit:
+                change = f"{(after - before) / before:+.0%}" if before else "new"
+                regressions.append(f"{key} {metric}: {before} -> {after} ({change})")
+    return regressions
+
+
+def run_sweep(args: argparse.Namespace) -> dict[str, dict]:
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as pool:
+        for max_analysts, max_num_turns, concurrency in itertools.product(args.analysts, args.turns, args.concurrency):
+            key = config_key(max_analysts, max_num_turns, concurrency)
+            settings = {
+                "max_analysts": max_analysts,
+                "max_num_turns": max_num_turns,
+                "concurrency": concurrency,
+                "llm_latency": args.llm_latency,
+                "search_latency": args.search_latency,
+                "completion_tokens": args.completion_tokens,
+                "document_chars": args.document_chars,
+            }
+            result = pool.submit(measure, settings).result()
+            results[key] = result
+            print(
+                f"{key:<16}{result['wall_s']:>9.2f}s{result['peak_rss_mb']:>9.1f}MB"
+                f"{result['checkpoint_kb']:>10.1f}KB{result['llm_calls']:>7} llm calls"
+            )
+            print("    " + " ".join(f"{node}={calls}" for node, calls in result["calls"].items()))
+    return results
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the research graphs offline against a fake model and retriever.")
+    parser.add_argument("--analysts", type=int, nargs="+", default=[2, 4], help="max_analysts values to sweep.")
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 2], help="max_num_turns values to sweep.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Interview concurrency values to sweep.")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake model call.")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="Seconds per fake search.")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Tokens per fake model response.")
+    parser.add_argument("--document-chars", type=int, default=2000, help="Characters per fake search result.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Baseline results to compare against.")
+    parser.add_argument("--update-baseline", action="store_true", help="Save these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown before flagging.")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    results = run_sweep(args)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        raise SystemExit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
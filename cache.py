@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Awaitable, Callable, Sequence
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, Generation
+
+DEFAULT_CACHE_DIR = ".cache"
+DEFAULT_LLM_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "llm.sqlite")
+DEFAULT_LLM_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_RETRIEVAL_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "retrieval.sqlite")
+
+# Seconds a retrieval result stays fresh, per source. Web results go stale quickly,
+# encyclopedia articles do not.
+DEFAULT_RETRIEVAL_TTLS = {
+    "tavily": 24 * 60 * 60,
+    "wikipedia-passages": 7 * 24 * 60 * 60,
+}
+DEFAULT_RETRIEVAL_TTL = 24 * 60 * 60
+# An empty result may just be a transient upstream hiccup, so it is retried soon.
+EMPTY_RESULT_TTL = 10 * 60
+
+# Classes a cached generation may revive to. Naming them keeps loads() from reviving
+# anything else from the cache file, and from warning about its default on every hit.
+CACHED_OBJECTS = [Generation, ChatGeneration, ChatGenerationChunk, AIMessage, AIMessageChunk]
+# loads() also flags itself as beta on use; cached replays should stay quiet.
+warnings.filterwarnings("ignore", message="The function `loads` is in beta", category=LangChainBetaWarning)
+
+# Message fields that change between otherwise identical runs (ids are minted by
+# add_messages, metadata comes back from the provider) and must not affect the key.
+VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Drop volatile fields from a serialized message list so equal conversations hash equally"""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+    for message in messages:
+        kwargs = message.get("kwargs") if isinstance(message, dict) else None
+        if isinstance(kwargs, dict):
+            for field in VOLATILE_MESSAGE_FIELDS:
+                kwargs.pop(field, None)
+    return json.dumps(messages, sort_keys=True)
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Content address for a call: model, parameters, bound schema and normalized messages"""
+    digest = hashlib.sha256()
+    digest.update(llm_string.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(_normalize_prompt(prompt).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LLMCache(BaseCache):
+    """Persistent SQLite cache for chat model calls with size-based LRU eviction.
+
+    Pass it to the model (`ChatOpenAI(..., cache=LLMCache())`) and every `invoke`,
+    including structured-output runnables built from that model, is memoized.
+    """
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, max_bytes: int = DEFAULT_LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_lru ON llm_cache (last_access)")
+        self._conn.commit()
+
+    def lookup(self, prompt: str, llm_string: str) -> Sequence[Generation] | None:
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return [loads(generation, allowed_objects=CACHED_OBJECTS) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = cache_key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def _evict(self):
+        """Remove least recently used entries until the store fits in max_bytes"""
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, strip punctuation and collapse whitespace so near-identical queries share an entry"""
+    query = re.sub(r"[^\w\s]", " ", query.casefold())
+    return " ".join(query.split())
+
+
+class RetrievalCache:
+    """Persistent TTL cache for retriever results with single-flight request coalescing.
+
+    Results are keyed on (source, normalized query). When several interview branches ask
+    for the same key at once, only the first one calls upstream; the others await
+    its result instead of issuing their own request. Failed fetches are not cached, and
+    empty results only for `EMPTY_RESULT_TTL`. Expired entries are pruned on open.
+    """
+
+    def __init__(self, path: str = DEFAULT_RETRIEVAL_CACHE_PATH, ttls: dict[str, float] | None = None):
+        self.path = path
+        self.ttls = {**DEFAULT_RETRIEVAL_TTLS, **(ttls or {})}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight: dict[tuple[str, str], asyncio.Task] = {}
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS retrieval_cache (
+                source TEXT NOT NULL,
+                query TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (source, query)
+            )"""
+        )
+        self._conn.commit()
+        self.prune()
+
+    def _ttl(self, source: str, value: list) -> float:
+        ttl = self.ttls.get(source, DEFAULT_RETRIEVAL_TTL)
+        return ttl if value else min(ttl, EMPTY_RESULT_TTL)
+
+    def _read(self, key: tuple[str, str]) -> list | None:
+        row = self._conn.execute(
+            "SELECT value, created_at FROM retrieval_cache WHERE source = ? AND query = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        if time.time() - row[1] > self._ttl(key[0], value):
+            return None
+        return value
+
+    def _write(self, key: tuple[str, str], value: list):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO retrieval_cache (source, query, value, created_at) VALUES (?, ?, ?, ?)",
+                (*key, json.dumps(value), time.time()),
+            )
+            self._conn.commit()
+
+    async def aget_or_fetch(self, source: str, query: str, fetch: Callable[[], Awaitable[list]]) -> list:
+        """Return cached results for the query; concurrent coroutines for the same key await one upstream task.
+
+        The upstream task is shielded, so a caller that gives up (e.g. on timeout) does
+        not cancel it for the others, and its result is still cached when it arrives.
+        """
+        key = (source, normalize_query(query))
+        with self._lock:
+            cached = self._read(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._afetch(key, fetch))
+            self._in_flight[key] = task
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _afetch(self, key: tuple[str, str], fetch: Callable[[], Awaitable[list]]) -> list:
+        try:
+            result = await fetch()
+            self._write(key, result)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
+
+    def prune(self):
+        """Delete entries that are past their source's TTL"""
+        now = time.time()
+        with self._lock:
+            sources = [source for (source,) in self._conn.execute("SELECT DISTINCT source FROM retrieval_cache")]
+            for source in sources:
+                ttl = self.ttls.get(source, DEFAULT_RETRIEVAL_TTL)
+                self._conn.execute("DELETE FROM retrieval_cache WHERE source = ? AND created_at < ?", (source, now - ttl))
+            self._conn.execute("DELETE FROM retrieval_cache WHERE value = '[]' AND created_at < ?", (now - EMPTY_RESULT_TTL,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
@@ -0,0 +1,112 @@
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+import aiosqlite
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from cache import DEFAULT_CACHE_DIR
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(DEFAULT_CACHE_DIR, "checkpoints.sqlite")
+DEFAULT_RUNS_DIR = os.path.join(DEFAULT_CACHE_DIR, "runs")
+# Retention: keep at most this many runs, and none older than this many days.
+DEFAULT_KEEP_RUNS = 20
+DEFAULT_MAX_AGE_DAYS = 14
+# Our own types stored in checkpoints, allowed back in when a checkpoint is loaded.
+CHECKPOINT_TYPES = [("schemas", "Analyst")]
+
+
+def new_run_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def analyst_thread_id(run_id: str) -> str:
+    return f"{run_id}-analysts"
+
+
+def research_thread_id(run_id: str) -> str:
+    return run_id
+
+
+@asynccontextmanager
+async def open_checkpointer(path: str = DEFAULT_CHECKPOINT_PATH):
+    """SQLite checkpointer for the analyst and research graphs"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    async with aiosqlite.connect(path) as conn:
+        yield AsyncSqliteSaver(conn, serde=JsonPlusSerializer(allowed_msgpack_modules=CHECKPOINT_TYPES))
+
+
+class RunRegistry:
+    """Book-keeping for research runs checkpointed in the SQLite saver's database.
+
+    Each run has two threads in the checkpointer (analyst generation and research) and
+    a document store file next to it. The registry remembers the run parameters so a
+    run can be resumed by id, and prunes old runs.
+    """
+
+    def __init__(self, saver: AsyncSqliteSaver, runs_dir: str = DEFAULT_RUNS_DIR):
+        self.saver = saver
+        self.runs_dir = runs_dir
+
+    async def setup(self):
+        await self.saver.setup()
+        await self.saver.conn.execute(
+            """CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                topic TEXT NOT NULL,
+                max_analysts INTEGER NOT NULL,
+                max_num_turns INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        await self.saver.conn.commit()
+        os.makedirs(self.runs_dir, exist_ok=True)
+
+    def document_store_path(self, run_id: str) -> str:
+        return os.path.join(self.runs_dir, f"{run_id}.documents.sqlite")
+
+    async def create(self, topic: str, max_analysts: int, max_num_turns: int) -> str:
+        run_id = new_run_id()
+        now = time.time()
+        await self.saver.conn.execute(
+            "INSERT INTO runs (run_id, topic, max_analysts, max_num_turns, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, topic, max_analysts, max_num_turns, "running", now, now),
+        )
+        await self.saver.conn.commit()
+        return run_id
+
+    async def get(self, run_id: str) -> dict | None:
+        async with self.saver.conn.execute(
+            "SELECT run_id, topic, max_analysts, max_num_turns, status, created_at FROM runs WHERE run_id = ?", (run_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        keys = ("run_id", "topic", "max_analysts", "max_num_turns", "status", "created_at")
+        return dict(zip(keys, row))
+
+    async def set_status(self, run_id: str, status: str):
+        await self.saver.conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (status, time.time(), run_id))
+        await self.saver.conn.commit()
+
+    async def prune(self, keep_runs: int = DEFAULT_KEEP_RUNS, max_age_days: float = DEFAULT_MAX_AGE_DAYS) -> list[str]:
+        """Delete the checkpoints and documents of runs beyond the retention policy.
+
+        Runs are ranked by their last activity, so a run that was just resumed counts as new.
+        """
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        async with self.saver.conn.execute("SELECT run_id, updated_at FROM runs ORDER BY updated_at DESC") as cursor:
+            rows = await cursor.fetchall()
+        expired = [run_id for position, (run_id, updated_at) in enumerate(rows) if position >= keep_runs or updated_at < cutoff]
+        for run_id in expired:
+            await self.saver.adelete_thread(analyst_thread_id(run_id))
+            await self.saver.adelete_thread(research_thread_id(run_id))
+            await self.saver.conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            path = self.document_store_path(run_id)
+            if os.path.exists(path):
+                os.remove(path)
+        await self.saver.conn.commit()
+        return expired
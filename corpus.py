@@ -0,0 +1,171 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter
+from cache import DEFAULT_CACHE_DIR
+from passages import BM25_B, BM25_K1, chunk_text, tokenize
+
+DEFAULT_CORPUS_DIR = os.getenv("CORPUS_DIR", "corpus")
+TEXT_EXTENSIONS = {".md", ".markdown", ".txt", ".rst"}
+PDF_EXTENSIONS = {".pdf"}
+
+
+def default_index_path(root: str) -> str:
+    digest = hashlib.sha256(os.path.abspath(root).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(DEFAULT_CACHE_DIR, f"corpus-{digest}.sqlite")
+
+
+def read_pages(path: str) -> list[tuple[str, str]] | None:
+    """(page, text) pairs of a corpus file; PDFs by page, text files as one unnamed page.
+
+    Returns None when the file cannot be read here, so it is retried on the next refresh.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PDF_EXTENSIONS:
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            print(f"Skipping {path}: install pypdf to index PDF files")
+            return None
+        return [(str(number), page.extract_text() or "") for number, page in enumerate(PdfReader(path).pages, 1)]
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return [("", f.read())]
+
+
+class CorpusIndex:
+    """Persistent BM25 inverted index over a directory of PDF, markdown and text files.
+
+    Files are split into passages that remember their file and page, and the postings
+    live in SQLite next to the other caches. `refresh` only re-reads files whose size
+    or modification time changed and drops files that disappeared, so keeping a large
+    corpus current is cheap, and a query only touches the postings of its own terms.
+    """
+
+    def __init__(self, root: str = DEFAULT_CORPUS_DIR, path: str | None = None):
+        self.root = root
+        self.path = path or default_index_path(root)
+        self._lock = threading.Lock()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS passages (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                page TEXT NOT NULL,
+                content TEXT NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS passages_path ON passages (path);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                passage_id INTEGER NOT NULL,
+                frequency INTEGER NOT NULL,
+                PRIMARY KEY (term, passage_id)
+            ) WITHOUT ROWID;"""
+        )
+        self._conn.commit()
+        self._load_statistics()
+
+    def _load_statistics(self):
+        count, total_length = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM passages").fetchone()
+        self.passage_count = count
+        self.average_length = total_length / count if count else 0.0
+
+    def _files(self) -> dict[str, os.stat_result]:
+        found = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if os.path.splitext(name)[1].lower() in TEXT_EXTENSIONS | PDF_EXTENSIONS:
+                    path = os.path.join(directory, name)
+                    found[path] = os.stat(path)
+        return found
+
+    def _remove(self, path: str):
+        self._conn.execute("DELETE FROM postings WHERE passage_id IN (SELECT id FROM passages WHERE path = ?)", (path,))
+        self._conn.execute("DELETE FROM passages WHERE path = ?", (path,))
+        self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _add(self, path: str, stat: os.stat_result) -> bool:
+        pages = read_pages(path)
+        if pages is None:
+            return False
+        for page, text in pages:
+            for passage in chunk_text(text):
+                frequencies = Counter(tokenize(passage))
+                cursor = self._conn.execute(
+                    "INSERT INTO passages (path, page, content, length) VALUES (?, ?, ?, ?)",
+                    (path, page, passage, sum(frequencies.values())),
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, passage_id, frequency) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, frequency) for term, frequency in frequencies.items()],
+                )
+        self._conn.execute(
+            "INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)", (path, stat.st_mtime, stat.st_size)
+        )
+        return True
+
+    def refresh(self) -> dict:
+        """Bring the index up to date with the directory, re-indexing only changed files"""
+        with self._lock:
+            found = self._files() if os.path.isdir(self.root) else {}
+            indexed = {path: (mtime, size) for path, mtime, size in self._conn.execute("SELECT path, mtime, size FROM files")}
+            removed = [path for path in indexed if path not in found]
+            changed = [
+                path for path, stat in found.items()
+                if indexed.get(path) != (stat.st_mtime, stat.st_size)
+            ]
+            added = 0
+            for path in removed:
+                self._remove(path)
+            for path in changed:
+                self._remove(path)
+                added += self._add(path, found[path])
+            self._conn.commit()
+            self._load_statistics()
+        return {"indexed": added, "removed": len(removed), "unchanged": len(found) - len(changed)}
+
+    def search(self, query: str, limit: int) -> list[dict]:
+        """Top `limit` passages for the query by BM25, as {"source", "page", "content"} dicts"""
+        terms = list(set(tokenize(query)))
+        if not terms or not self.passage_count:
+            return []
+        placeholders = ", ".join("?" * len(terms))
+        with self._lock:
+            document_frequencies = self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall()
+            if not document_frequencies:
+                return []
+            weights = []
+            for term, df in document_frequencies:
+                weights += [term, math.log(1 + (self.passage_count - df + 0.5) / (df + 0.5))]
+            # Scored and ranked inside SQLite so only the winning passages come back.
+            rows = self._conn.execute(
+                f"""WITH weights (term, idf) AS (VALUES {", ".join(["(?, ?)"] * len(document_frequencies))}),
+                scores AS (
+                    SELECT postings.passage_id, SUM(
+                        weights.idf * postings.frequency * ? / (postings.frequency + ? * (1 - ? + ? * passages.length / ?))
+                    ) AS score
+                    FROM weights
+                    JOIN postings ON postings.term = weights.term
+                    JOIN passages ON passages.id = postings.passage_id
+                    GROUP BY postings.passage_id
+                    ORDER BY score DESC
+                    LIMIT ?
+                )
+                SELECT passages.path, passages.page, passages.content
+                FROM scores JOIN passages ON passages.id = scores.passage_id
+                ORDER BY scores.score DESC""",
+                [*weights, BM25_K1 + 1, BM25_K1, BM25_B, BM25_B, max(self.average_length, 1.0), limit],
+            ).fetchall()
+        return [{"source": path, "page": page, "content": content} for path, page, content in rows]
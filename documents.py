@@ -0,0 +1,238 @@
+import hashlib
+import re
+import sqlite3
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from pydantic import BaseModel
+
+# Query parameters that only track where a link was clicked and never change the page.
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+SHINGLE_SIZE = 3
+# Simhashes at most this many bits apart are treated as the same document.
+NEAR_DUPLICATE_DISTANCE = 3
+
+# Ids are "d" plus the first ID_DIGITS hex digits of a hash of the document's key,
+# lengthened one digit at a time when that id is already taken by another document.
+ID_DIGITS = 7
+
+CITATION_PATTERN = re.compile(r"\[(\s*d[0-9a-f]{7,64}\s*(?:[,;]\s*d[0-9a-f]{7,64}\s*)*)\]")
+DOCUMENT_ID_PATTERN = re.compile(r"d[0-9a-f]{7,64}")
+SOURCES_HEADER_PATTERN = re.compile(r"^#{2,3} Sources\s*$", re.MULTILINE)
+
+
+class SourceDocument(BaseModel):
+    """A retrieved document. Web results are cited by link, everything else by source and page."""
+    id: str = ""
+    source: str
+    page: str = ""
+    content: str
+    is_link: bool = False
+
+    def attributes(self) -> str:
+        if self.is_link:
+            return f'id="{self.id}" href="{self.source}"'
+        return f'id="{self.id}" source="{self.source}" page="{self.page}"'
+
+    def format(self) -> str:
+        return f"<Document {self.attributes()}/>\n{self.content}\n</Document>"
+
+    def citation(self) -> str:
+        if self.is_link or not self.page:
+            return self.source
+        return f"{self.source}, page {self.page}"
+
+
+def canonical_url(url: str) -> str:
+    """Normalize a link so trivially different spellings of the same page compare equal"""
+    parts = urlsplit(url.strip())
+    if not parts.scheme or not parts.netloc:
+        return url.strip()
+    netloc = parts.netloc.lower().removeprefix("www.")
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query)
+        if not key.startswith("utm_") and key not in TRACKING_PARAMS
+    ))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme, netloc, path, query, ""))
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(_normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _shingle_hashes(text: str) -> list[int]:
+    words = _normalize_text(text).split()
+    phrases = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))]
+    return [int.from_bytes(hashlib.blake2b(phrase.encode("utf-8"), digest_size=8).digest(), "big") for phrase in phrases]
+
+
+def shingles(text: str) -> set[int]:
+    """Hashes of the text's word shingles, for measuring how much of it is new"""
+    return set(_shingle_hashes(text)) if text.strip() else set()
+
+
+def simhash(text: str) -> int:
+    """64-bit simhash over word shingles; near-identical texts differ in few bits"""
+    weights = [0] * 64
+    for value in _shingle_hashes(text):
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class DocumentStore:
+    """Run-wide store of retrieved documents, shared by every interview.
+
+    Documents are deduplicated by canonical URL, exact content hash and simhash
+    near-duplicate detection, and identified by a short id derived from their
+    canonical source, so the same page gets the same id across analysts and runs.
+    Graph state only carries these ids. Pass a `path` to persist the store in SQLite
+    so a resumed run can still resolve them.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._documents: dict[str, SourceDocument] = {}
+        self._by_source: dict[str, str] = {}
+        self._by_hash: dict[str, str] = {}
+        self._simhashes: dict[str, int] = {}
+        self.duplicates = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                page TEXT NOT NULL,
+                content TEXT NOT NULL,
+                is_link INTEGER NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        for id, source, page, content, is_link in self._conn.execute("SELECT id, source, page, content, is_link FROM documents"):
+            self._index(SourceDocument(id=id, source=source, page=page, content=content, is_link=bool(is_link)))
+
+    def _index(self, document: SourceDocument):
+        self._documents[document.id] = document
+        if document.source:
+            self._by_source[self._source_key(document)] = document.id
+        self._by_hash[content_hash(document.content)] = document.id
+        self._simhashes[document.id] = simhash(document.content)
+
+    def _source_key(self, document: SourceDocument) -> str:
+        return f"{canonical_url(document.source)}#{document.page}"
+
+    def _save(self, document: SourceDocument):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (id, source, page, content, is_link) VALUES (?, ?, ?, ?, ?)",
+            (document.id, document.source, document.page, document.content, int(document.is_link)),
+        )
+        self._conn.commit()
+
+    def _near_duplicate(self, fingerprint: int) -> str | None:
+        for id, other in self._simhashes.items():
+            if (fingerprint ^ other).bit_count() <= NEAR_DUPLICATE_DISTANCE:
+                return id
+        return None
+
+    def _new_id(self, key: str) -> str:
+        """Shortest id from the key's hash that no stored document has yet"""
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        length = ID_DIGITS
+        while f"d{digest[:length]}" in self._documents and length < len(digest):
+            length += 1
+        return f"d{digest[:length]}"
+
+    def add(self, document: SourceDocument) -> str:
+        """Store the document unless it is already known and return its id"""
+        with self._lock:
+            digest = content_hash(document.content)
+            if digest in self._by_hash:
+                self.duplicates += 1
+                return self._by_hash[digest]
+
+            source_key = self._source_key(document) if document.source else None
+            if source_key in self._by_source:
+                # Same page reached through another query: search snippets differ per
+                # query, so keep the new text alongside what we already have.
+                existing = self._documents[self._by_source[source_key]]
+                self.duplicates += 1
+                if _normalize_text(document.content) not in _normalize_text(existing.content):
+                    existing.content = f"{existing.content}\n\n{document.content}"
+                    self._by_hash[digest] = existing.id
+                    self._simhashes[existing.id] = simhash(existing.content)
+                    self._save(existing)
+                return existing.id
+
+            fingerprint = simhash(document.content)
+            if (near := self._near_duplicate(fingerprint)) is not None:
+                self.duplicates += 1
+                self._by_hash[digest] = near
+                return near
+
+            key = source_key or digest
+            document = document.model_copy(update={"id": self._new_id(key)})
+            self._index(document)
+            self._save(document)
+            return document.id
+
+    def get(self, id: str) -> SourceDocument | None:
+        return self._documents.get(id)
+
+    def get_many(self, ids: list[str]) -> list[SourceDocument]:
+        """Documents for `ids` in order, skipping repeats and unknown ids"""
+        return [self._documents[id] for id in dict.fromkeys(ids) if id in self._documents]
+
+    def format(self, ids: list[str]) -> str:
+        return "\n\n---\n\n".join([document.format() for document in self.get_many(ids)])
+
+    def number_citations(self, text: str) -> str:
+        """Replace document-id citations with sequential numbers and append a Sources section.
+
+        Numbers follow the order in which documents are first cited, so the same text
+        always produces the same numbering. Any Sources section the writer added is
+        dropped in favour of the one built from the store.
+        """
+        match = SOURCES_HEADER_PATTERN.search(text)
+        if match:
+            text = text[:match.start()].rstrip()
+        numberer = CitationNumberer(self)
+        text = numberer.renumber(text)
+        if not numberer.numbers:
+            return text
+        return f"{text}\n\n{numberer.sources()}"
+
+    def stats(self) -> dict:
+        return {"documents": len(self._documents), "duplicates": self.duplicates}
+
+
+class CitationNumberer:
+    """Incrementally maps cited document ids to numbers in order of first citation.
+
+    Feeding text through `renumber` piece by piece, in reading order, yields the same
+    numbers as renumbering the whole text at once.
+    """
+
+    def __init__(self, store: DocumentStore):
+        self.store = store
+        self.numbers: dict[str, int] = {}
+
+    def _replace(self, citation: re.Match) -> str:
+        cited = []
+        for id in DOCUMENT_ID_PATTERN.findall(citation.group(1)):
+            if self.store.get(id) is None:
+                continue
+            number = self.numbers.setdefault(id, len(self.numbers) + 1)
+            if number not in cited:
+                cited.append(number)
+        return ", ".join(f"[{number}]" for number in cited)
+
+    def renumber(self, text: str) -> str:
+        return CITATION_PATTERN.sub(self._replace, text)
+
+    def sources(self) -> str:
+        sources = "\n\n".join(f"[{number}] {self.store.get(id).citation()}" for id, number in self.numbers.items())
+        return f"## Sources\n\n{sources}"
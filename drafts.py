@@ -0,0 +1,41 @@
+import asyncio
+from typing import Awaitable, Callable
+
+
+class SectionDrafts:
+    """Memo drafts revised in the background while their interviews carry on.
+
+    Each revision is a task that starts from the draft the previous revision of the same
+    interview produced, so revisions apply in turn order without holding up the next
+    question. A revision that fails leaves the draft as None, and later revisions of that
+    interview are skipped so the memo can be written from scratch instead.
+    """
+
+    def __init__(self):
+        self._tasks: dict[str, list[asyncio.Task]] = {}
+
+    def revise(self, interview_id: str, revision: Callable[[str], Awaitable[str]]):
+        tasks = self._tasks.setdefault(interview_id, [])
+        previous = tasks[-1] if tasks else None
+
+        async def run() -> str | None:
+            draft = await previous if previous is not None else ""
+            if draft is None:
+                return None
+            try:
+                return await revision(draft)
+            except Exception as e:
+                print(f"Draft revision failed for interview {interview_id}: {e}")
+                return None
+
+        tasks.append(asyncio.create_task(run()))
+
+    async def pop(self, interview_id: str) -> str | None:
+        """The interview's draft once all its revisions are done, forgetting it"""
+        tasks = self._tasks.pop(interview_id, [])
+        return await tasks[-1] if tasks else None
+
+    def discard(self, interview_id: str):
+        """Cancel the revisions of an interview that will not be written up"""
+        for task in self._tasks.pop(interview_id, []):
+            task.cancel()
@@ -1,12 +1,21 @@
+import asyncio
+import re
+import uuid
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
-from schemas import Analyst, InterviewState, SearchQuestion
+from schemas import Analyst, InterviewState, SearchQueries
 from langchain_core.messages import SystemMessage, get_buffer_string
-from langchain_tavily import TavilySearch
-from langchain_community.document_loaders import WikipediaLoader
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, AnyMessage, RemoveMessage
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
+from cache import RetrievalCache
+from retrievers import Retriever, build_retrievers
+from scheduler import Scheduler, CHARS_PER_TOKEN
+from passages import select_context
+from documents import DocumentStore, shingles
+from tracing import emit, RETRIEVAL_EVENT
+from transcripts import TranscriptStore
+from drafts import SectionDrafts
+from models import ModelRouter, as_router
 
 
 QUESTION_INSTRUCTIONS = """You are an analyst tasked with interviewing an expert to learn about a specific topic.
@@ -27,11 +36,12 @@ Remember to stay in character throughout your response, reflecting the persona a
 """
 
 SEARCH_INSTRUCTIONS = """You will be given a conversation between an anaylyst and an expert.
-Your goal is to generate a well-structured query for use in retrieval and / or web-search related to the conversation.
+Your goal is to generate well-structured queries for use in retrieval and / or web-search related to the conversation.
 
 First, analyze the full conversation.
 Pay particular attention to the final question posed by the analyst.
-Convert this final question into a well-structured web search query.
+Convert this final question into at most {max_queries} well-structured web search queries.
+Only add more than one query when the question covers clearly distinct aspects.
 """
 
 ANSWER_INSTRUCTIONS = """You are an expert being interviewed by an analyst.
@@ -47,19 +57,27 @@ When answering questions, follow these guidelines:
 1. Use only the information provided in the context.
 2. Do not introduce external information or make assumptions beyond what is explicitly stated in the context.
 3. The context contain sources at the topic of each individual document.
-4. Include these sources of your answer next to any relevant statements. For example , for source #1 use [1].
-5. List your sources in order at the bottom of your answer. [1] Source 1, [2] Source 2, etc.
-6. If the source is <Document source="assistant/docs/llama3_1.pdf" page="7"> then just list
-[1] assistant/docs/llama3_1.pdf, page 7
+4. Each document has an id, for example <Document id="d3f9a1c2" href="..."/>.
+5. Cite sources next to any relevant statements using the document id in brackets. For example, for document d3f9a1c2 use [d3f9a1c2].
+6. Do not list the sources at the bottom of your answer.
+"""
+
+COMPACTION_INSTRUCTIONS = """You are keeping notes on an interview between an analyst and an expert.
+
+You will be given the current notes followed by the next part of the interview.
 
-And skip the addition of the brackets as well as the Document source preamble in your citation.
+Update the notes so that they also cover the new part:
+1. Keep every specific fact, figure and example the expert gave, with its citations exactly as written, for example [d3f9a1c2].
+2. Keep a brief list of the questions the analyst already asked, so they are not asked again.
+3. Drop greetings, pleasantries and repetition.
+4. Keep the notes under {max_words} words. Include no pre-amble.
 """
 
 SECTION_WRITER_INSTRUCTIONS = """You are an expert technical writer.
 Your task is to create a short, easily digestible summary of a report based on a set of source documnets.
 
 1. Analyze the content of the source documents.
-- The name of the source document is at the start of the document with the <Document> tag
+- The id and source of each document is at the start of the document with the <Document> tag
 
 2. Create a report structure using markdown formatting
 - Use ## for the section title
@@ -68,30 +86,19 @@ Your task is to create a short, easily digestible summary of a report based on a
 3. Write the report following this structure:
 a. Title (## header)
 b. Summary (### header)
-c. Sources (### header)
 
 4. Make your title engaging base upon the focus area of the analyst:
 {focus}
 5. For the summary section:
 - Set up summary with general background / context related to the focus area of the analyst.
 - Emphasize what is novel, interesting or surprising about insights gathered from the interview.
-- Create a numbered list of source documents as you use them
 - Do not mention the name of there interviewers or experts
 - Aim for approximately 400 works maximum
-- Use numbered sources in your report (e.g. [1], [2]) based on information from source documents
+- Cite source documents by their id in brackets (e.g. [d3f9a1c2]) next to the information taken from them
 
-6. In the sources section:
-- Include all sources used in your report.
-- Provide full links of relevant websites or specific document paths
-- Separate each source by a newline. Use two spaces at the end of each line to create newline in Markdown.
-- It will look like:
+6. Do not add a sources section. Sources are numbered and listed automatically from the document ids you cite.
 
-### Sources
-[1] Link or Document name
-[2] Link or Document name
-
-7. Be sure to combine sources. For example this is not correct:
-[3] https://ai.meta.com/blog/meta-llama-3-1/
+7. Only cite ids that appear in the <Document> tags. Never invent an id or replace it with a link or a number.
 
 8. Final review:
 - Ensure the report follows the required structure
@@ -99,113 +106,271 @@ c. Sources (### header)
 - Check that all guidelines have been followed
 """
 
-MAX_RESULTS = 3
+DRAFT_INSTRUCTIONS = """You are an expert technical writer keeping a memo up to date while an interview is still going on.
+
+You will be given the current draft of the memo (it may be empty), the analyst's latest question, and the sources newly retrieved for it; the draft already covers the earlier ones.
+
+Revise the draft so it also covers what these sources add:
+1. The analyst's focus area is:
+{focus}
+2. Keep the structure: a title (## header) followed by a summary (### Summary header).
+3. Keep what the draft already says, with its citations, unless the new sources correct it. Add the new insights where they fit and drop repetition.
+4. Emphasize what is novel, interesting or surprising, and do not mention the names of the interviewers or experts.
+5. Cite sources by their id in brackets (e.g. [d3f9a1c2]) next to the information taken from them. Only cite ids that appear in the draft or in the <Document> tags.
+6. Aim for approximately {max_words} words at most, do not add a sources section, and include no preamble before the title.
+"""
+
+MAX_QUERIES = 3
+
+# Token budgets and passage caps for the context handed to the expert and the section
+# writer; only the passages ranked most relevant are included.
+ANSWER_CONTEXT_TOKENS = 3000
+ANSWER_TOP_K = 12
+SECTION_CONTEXT_TOKENS = 6000
+SECTION_TOP_K = 30
+SECTION_WORDS = 400
+SECTION_TITLE = re.compile(r"^## ", re.MULTILINE)
+
+# Once the interview's messages exceed this many tokens, the turns before the last
+# KEEP_RECENT_TURNS are folded into a running summary before the next question.
+COMPACTION_THRESHOLD_TOKENS = 4000
+KEEP_RECENT_TURNS = 2
+SUMMARY_WORDS = 400
+
+# A turn's novelty averages the share of its retrieved documents and of its answer's
+# shingles not seen earlier in the interview; below this the interview stops early.
+NOVELTY_THRESHOLD = 0.25
 
 class InterviewAgent:
-    def __init__(self, llm: ChatOpenAI):
+    def __init__(
+        self,
+        llm: ChatOpenAI | ModelRouter,
+        retrieval_cache: RetrievalCache | None = None,
+        retrievers: list[Retriever] | None = None,
+        llm_scheduler: Scheduler | None = None,
+        search_scheduler: Scheduler | None = None,
+        answer_context_tokens: int = ANSWER_CONTEXT_TOKENS,
+        section_context_tokens: int = SECTION_CONTEXT_TOKENS,
+        document_store: DocumentStore | None = None,
+        novelty_threshold: float = NOVELTY_THRESHOLD,
+        incremental_sections: bool = False,
+        compaction_threshold_tokens: int | None = COMPACTION_THRESHOLD_TOKENS,
+        keep_recent_turns: int = KEEP_RECENT_TURNS,
+    ):
         self.llm = llm
+        self.models = as_router(llm)
+        self.novelty_threshold = novelty_threshold
+        self.incremental_sections = incremental_sections
+        self.drafts = SectionDrafts()
+        self.compaction_threshold_tokens = compaction_threshold_tokens
+        self.keep_recent_turns = max(keep_recent_turns, 1)
+        self.transcripts = TranscriptStore()
+        self.document_store = document_store or DocumentStore()
+        self.answer_context_tokens = answer_context_tokens
+        self.section_context_tokens = section_context_tokens
+        self.retrieval_cache = retrieval_cache or RetrievalCache()
+        self.retrievers = retrievers if retrievers is not None else build_retrievers()
+        # Retrievers passed in may be shared with other agents; only ours are closed.
+        self._owned_retrievers = self.retrievers if retrievers is None else []
+        self.llm_scheduler = llm_scheduler or Scheduler("llm")
+        self.search_scheduler = search_scheduler or Scheduler("search")
         self.graph = self._build_graph()
-        self.search = TavilySearch(max_results=MAX_RESULTS)
+
+    async def aclose(self):
+        """Close the connections of the retrievers this agent built"""
+        await asyncio.gather(*[retriever.aclose() for retriever in self._owned_retrievers])
+
+    def discard(self, interview_id: str):
+        """Drop what is kept outside the state for an interview that did not finish"""
+        self.transcripts.pop(interview_id)
+        self.drafts.discard(interview_id)
 
     def _build_graph(self):
-        def ask_question(state: InterviewState):
+        question_llm = self.models.chat("ask_question")
+        query_llm = self.models.structured("plan_queries", SearchQueries)
+        answer_llm = self.models.chat("generate_answer")
+        compaction_llm = self.models.chat("compact_history")
+        section_llm = self.models.chat("write_section")
+        # Draft revisions run in the background of generate_answer; tag their calls so
+        # traces attribute them to the revisions rather than to the answer.
+        draft_llm = self.models.chat("revise_draft").with_config(metadata={"langgraph_node": "revise_draft"})
+
+        def history(state: InterviewState) -> list[AnyMessage]:
+            """The conversation as prompts see it: the running summary, then the recent turns"""
+            if not state.summary:
+                return state.messages
+            return [SystemMessage(content=f"Notes on the earlier part of the interview:\n{state.summary}"), *state.messages]
+
+        def progress(state: InterviewState) -> int:
+            """Messages exchanged so far, including compacted ones; used as the scheduler priority"""
+            return state.compacted_messages + len(state.messages)
+
+        async def ask_question(state: InterviewState):
             """Node to generate a question"""
             analyst = state.analyst
-            messages = state.messages
             system_message = SystemMessage(content=QUESTION_INSTRUCTIONS.format(goals=analyst.persona))
-            question = self.llm.invoke([system_message, *messages])
+            question = await self.llm_scheduler.ainvoke(question_llm, [system_message, *history(state)], priority=progress(state))
             return {"messages": [question]}
 
-        def search_web(state: InterviewState):
-            """Retrieve docs from web search"""
-
-            structured_llm = self.llm.with_structured_output(SearchQuestion)
-            search_system_message = SystemMessage(content=SEARCH_INSTRUCTIONS)
-            search_query = structured_llm.invoke([search_system_message, *state.messages])
-            data = self.search.invoke({"query": search_query.search_query})
-            if isinstance(data, dict):
-                search_docs = data.get("results", [])
-            else:
-                search_docs = []
-
-            formatted_docs = "\n\n---\n\n".join([
-                f'<Document href="{doc.get("url")}"/>\n{doc.get("content")}\n</Document>'
-                for doc in search_docs
-            ])
-            return {"context": [formatted_docs]}
-
-        def search_wikipedia(state: InterviewState):
-            """Retrieve data from Wikipedia"""
-
-            structured_llm = self.llm.with_structured_output(SearchQuestion)
-            search_system_message = SystemMessage(content=SEARCH_INSTRUCTIONS)
-            search_query = structured_llm.invoke([search_system_message, *state.messages])
-            search_docs = WikipediaLoader(query=search_query.search_query, load_max_docs=MAX_RESULTS).load()
-            formatted_docs = "\n\n---\n\n".join([
-                f'<Document source="{doc.metadata.get("source")}" page="{doc.metadata.get("page", "")}"/>\n{doc.page_content}\n</Document>'
-                for doc in search_docs
-            ])
-            return {"context": [formatted_docs]}
-
-        def generate_answer(state: InterviewState):
+        async def plan_queries(state: InterviewState):
+            """Generate the search queries for the last question once, for every retriever"""
+            search_system_message = SystemMessage(content=SEARCH_INSTRUCTIONS.format(max_queries=MAX_QUERIES))
+            search_queries = await self.llm_scheduler.ainvoke(query_llm, [search_system_message, *history(state)], priority=progress(state))
+            return {"search_queries": search_queries.search_queries[:MAX_QUERIES]}
+
+        async def retrieve(state: InterviewState):
+            """Fan the planned queries out to every retriever concurrently"""
+            searches = [(retriever, query) for retriever in self.retrievers for query in state.search_queries]
+            priority = progress(state)
+            results = await asyncio.gather(
+                *[
+                    asyncio.wait_for(retriever.asearch(query, self.retrieval_cache, self.search_scheduler, priority), retriever.timeout)
+                    for retriever, query in searches
+                ],
+                return_exceptions=True,
+            )
+            context = []
+            retrieved = set()
+            for (retriever, query), search_docs in zip(searches, results):
+                if isinstance(search_docs, TimeoutError):
+                    print(f"{retriever.name} timed out after {retriever.timeout}s for query: {query}")
+                    continue
+                if isinstance(search_docs, Exception):
+                    print(f"{retriever.name} failed for query: {query}: {search_docs}")
+                    continue
+                documents = [retriever.to_document(doc) for doc in search_docs]
+                await emit(RETRIEVAL_EVENT, {
+                    "retriever": retriever.name,
+                    "bytes": sum(len(document.content.encode("utf-8")) for document in documents),
+                    "documents": len(documents),
+                })
+                for document in documents:
+                    doc_id = self.document_store.add(document)
+                    retrieved.add(doc_id)
+                    if doc_id not in state.context and doc_id not in context:
+                        context.append(doc_id)
+            # An empty retrieval (every retriever failed or timed out) says nothing about
+            # whether the topic is exhausted, so it must not end the interview by itself.
+            document_novelty = len(context) / len(retrieved) if retrieved else 1.0
+            return {"context": context, "new_context": context, "document_novelty": document_novelty}
+
+        async def generate_answer(state: InterviewState):
             """Node to answer the question"""
             analyst = state.analyst
             messages = state.messages
-            context = state.context
+            query = " ".join([messages[-1].content, *state.search_queries])
+            documents = self.document_store.get_many(state.context)
+            context = select_context(documents, query, self.answer_context_tokens, ANSWER_TOP_K)
+            interview_id = state.interview_id or uuid.uuid4().hex
+            if self.incremental_sections and state.new_context:
+                # Fold only the documents this turn retrieved into the memo draft, in the
+                # background while the expert answers and the interview moves on; the
+                # earlier documents are already in the draft.
+                question = messages[-1].content
+                priority = progress(state)
+                new_context = select_context(self.document_store.get_many(state.new_context), query, self.answer_context_tokens, ANSWER_TOP_K)
+
+                async def revise(draft: str) -> str:
+                    system_message = SystemMessage(content=DRAFT_INSTRUCTIONS.format(focus=analyst.description, max_words=SECTION_WORDS))
+                    human_msg = HumanMessage(content=f"Current draft:\n{draft or '(empty)'}\n\nLatest question:\n{question}\n\nNew sources:\n{new_context}")
+                    revised = await self.llm_scheduler.ainvoke(draft_llm, [system_message, human_msg], priority=priority)
+                    return revised.content
+
+                self.drafts.revise(interview_id, revise)
             system_message = SystemMessage(content=ANSWER_INSTRUCTIONS.format(goals=analyst.persona, context=context))
-            answer = self.llm.invoke([system_message, *messages])
+            answer = await self.llm_scheduler.ainvoke(answer_llm, [system_message, *history(state)], priority=progress(state))
             answer.name = "expert"
-            return {"messages": [answer]}
-
-        def save_interview(state: InterviewState):
+            answer_shingles = shingles(answer.content)
+            answer_novelty = len(answer_shingles - state.seen_shingles) / len(answer_shingles) if answer_shingles else 0.0
+            return {
+                "messages": [answer],
+                "interview_id": interview_id,
+                "num_responses": state.num_responses + 1,
+                "novelty": (state.document_novelty + answer_novelty) / 2,
+                "seen_shingles": state.seen_shingles | answer_shingles,
+            }
+
+        async def compact_history(state: InterviewState):
+            """Fold the turns before the most recent ones into the running summary once the history is too long"""
+            tokens = sum(len(str(message.content)) for message in state.messages) // CHARS_PER_TOKEN
+            keep = 2 * self.keep_recent_turns
+            if self.compaction_threshold_tokens is None or tokens <= self.compaction_threshold_tokens or len(state.messages) <= keep:
+                return {}
+            compacted = state.messages[:-keep]
+            self.transcripts.append(state.interview_id, compacted)
+            # Only the newly compacted turns are summarized, on top of the previous notes.
+            system_message = SystemMessage(content=COMPACTION_INSTRUCTIONS.format(max_words=SUMMARY_WORDS))
+            human_msg = HumanMessage(content=f"Current notes:\n{state.summary or '(none yet)'}\n\nNext part of the interview:\n{get_buffer_string(compacted)}")
+            summary = await self.llm_scheduler.ainvoke(compaction_llm, [system_message, human_msg], priority=progress(state))
+            return {
+                "messages": [RemoveMessage(id=message.id) for message in compacted],
+                "summary": summary.content,
+                "compacted_messages": state.compacted_messages + len(compacted),
+            }
+
+        async def save_interview(state: InterviewState):
             """Save the interview"""
-            full_interview = get_buffer_string(state.messages)
+            full_interview = get_buffer_string([*self.transcripts.pop(state.interview_id), *state.messages])
             return {"interview": full_interview}
 
-        def route_message(state: InterviewState, name: str = "expert"):
+        def route_message(state: InterviewState):
             """Route between question and answer nodes"""
 
             messages = state.messages
-            max_num_turns = state.max_num_turns
-            num_responses = len(
-                [m for m in messages if isinstance(m, AIMessage) and m.name == name]
-            )
 
-            if num_responses >= max_num_turns:
+            if state.num_responses >= state.max_num_turns:
+                return "save_interview"
+
+            # Another turn is unlikely to pay for its model and search calls once the
+            # last one mostly re-retrieved known documents and restated earlier answers.
+            if state.novelty < self.novelty_threshold:
                 return "save_interview"
 
             last_question = messages[-2]
 
             if "Thank you so much for your help!" in last_question.content:
                 return "save_interview"
-            return "ask_question"
-
-        def write_section(state: InterviewState):
-            """Write a section of the report"""
-            context = state.context
+            return "compact_history"
+
+        async def write_section(state: InterviewState):
+            """Write a section of the report, finishing the draft kept during the interview if there is one"""
+            draft = await self.drafts.pop(state.interview_id) if self.incremental_sections else None
+            if draft:
+                # The draft was revised after every answer, so only the preamble a
+                # model sometimes adds before the title is left to remove.
+                title = SECTION_TITLE.search(draft)
+                return {"sections": [draft[title.start() if title else 0:].strip()]}
             analyst = state.analyst
+            questions = [m.content for m in state.messages if isinstance(m, AIMessage) and m.name != "expert"]
+            query = " ".join([analyst.description, state.summary, *questions])
+            documents = self.document_store.get_many(state.context)
+            context = select_context(documents, query, self.section_context_tokens, SECTION_TOP_K)
             system_message = SystemMessage(content=SECTION_WRITER_INSTRUCTIONS.format(focus=analyst.description))
             human_msg = HumanMessage(content=f"Us this source to write your section: {context}")
-            section = self.llm.invoke([system_message, human_msg])
+            section = await self.llm_scheduler.ainvoke(section_llm, [system_message, human_msg], priority=progress(state))
             return {"sections": [section.content]}
 
         def build_interview_section_graph():
             """Build the graph for writing a section of the report"""
             builder = StateGraph(InterviewState)
             builder.add_node("ask_question", ask_question)
-            builder.add_node("search_web", search_web)
-            builder.add_node("search_wikipedia", search_wikipedia)
+            builder.add_node("plan_queries", plan_queries)
+            builder.add_node("retrieve", retrieve)
             builder.add_node("generate_answer", generate_answer)
+            builder.add_node("compact_history", compact_history)
             builder.add_node("save_interview", save_interview)
             builder.add_node("write_section", write_section)
 
             builder.add_edge(START, "ask_question")
-            builder.add_edge("ask_question", "search_web")
-            builder.add_edge("ask_question", "search_wikipedia")
-            builder.add_edge(["search_web", "search_wikipedia"], "generate_answer")
-            builder.add_conditional_edges("generate_answer", route_message, ["ask_question", "save_interview", "write_section"])
+            builder.add_edge("ask_question", "plan_queries")
+            builder.add_edge("plan_queries", "retrieve")
+            builder.add_edge("retrieve", "generate_answer")
+            builder.add_conditional_edges("generate_answer", route_message, ["compact_history", "save_interview", "write_section"])
+            builder.add_edge("compact_history", "ask_question")
             builder.add_edge("save_interview", "write_section")
             builder.add_edge("write_section", END)
-            memory = MemorySaver()
-            return builder.compile(checkpointer=memory)
+            # Interviews run inside the research graph's conduct_interview node, which is
+            # checkpointed as a whole; snapshotting every turn would only pile up copies
+            # of the growing context.
+            return builder.compile(checkpointer=False)
         return build_interview_section_graph()
\ No newline at end of file
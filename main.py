@@ -1,58 +1,269 @@
+import argparse
+import asyncio
+from typing import Callable
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from pydantic import BaseModel, Field
 from analyst import AnalystAgent
 from schemas import ResearchState, GeneratAnalystState, Analyst
 from interview import InterviewAgent
-from research import ResearchAgent
+from research import ResearchAgent, MAX_CONCURRENCY
+from cache import LLMCache, RetrievalCache
+from scheduler import Scheduler
+from streaming import ReportStreamer
+from documents import DocumentStore
+from tracing import Tracer
+from models import ModelRouter, build_router, load_routes
+from checkpoints import (
+    RunRegistry,
+    open_checkpointer,
+    analyst_thread_id,
+    research_thread_id,
+    DEFAULT_CHECKPOINT_PATH,
+    DEFAULT_KEEP_RUNS,
+    DEFAULT_MAX_AGE_DAYS,
+)
 
 load_dotenv()
 
+# Budgets for the shared schedulers; set them a little under the account's limits.
+LLM_REQUESTS_PER_MINUTE = 500
+LLM_TOKENS_PER_MINUTE = 200_000
+SEARCH_REQUESTS_PER_MINUTE = 100
 
-def run_analyst_agent(llm: ChatOpenAI, topic: str, max_analysts: int) -> tuple[list[Analyst], str]:
-    analyst_agent = AnalystAgent(llm)
+
+def build_llm(llm_cache: LLMCache | None = None, routes_path: str | None = None) -> ModelRouter:
+    """The model router for every graph node, from a routing file or the default routes"""
+    if routes_path is None:
+        return build_router(llm_cache)
+    default, routes = load_routes(routes_path)
+    return build_router(llm_cache, default, routes)
+
+
+async def run_analyst_agent(
+    llm: ChatOpenAI | ModelRouter,
+    topic: str,
+    max_analysts: int,
+    scheduler: Scheduler | None = None,
+    feedback: list[str] | None = None,
+    thread_id: str = "1",
+    verbose: bool = True,
+    checkpointer: BaseCheckpointSaver | None = None,
+    tracer: Tracer | None = None,
+    on_analysts: Callable[[list[Analyst]], None] | None = None,
+    analyst_agent: AnalystAgent | None = None,
+) -> tuple[list[Analyst], str]:
+    """Generate the analysts, asking for feedback on stdin unless `feedback` is given.
+
+    Pre-supplied feedback is applied one entry per regeneration pass; once it runs
+    out the analysts are accepted. A thread that already has a checkpoint is picked
+    up where it stopped instead of starting over. `on_analysts` is called with each
+    proposed set of analysts before asking for feedback on it. Pass an `analyst_agent`
+    to reuse its compiled graph across runs.
+    """
+    analyst_agent = analyst_agent or AnalystAgent(llm, scheduler, checkpointer)
     generate_analyst_state = GeneratAnalystState(topic=topic, max_analysts=max_analysts)
-    thread = {"configurable": {"thread_id": "1"}}
+    thread = {"configurable": {"thread_id": thread_id}, "callbacks": [tracer] if tracer else []}
     graph = analyst_agent.graph
+    pending_feedback = list(feedback) if feedback is not None else None
     state_next = ("START",)
+    snapshot = await graph.aget_state(thread)
+    if snapshot.values:
+        generate_analyst_state = None
+        state_next = snapshot.next
     while state_next:
         if isinstance(state_next, tuple) and 'human_feedback' in state_next:
-            human_feedback = input("Any additional feedback to guide the analyst generation. Press Enter to continue: ")
+            if on_analysts:
+                on_analysts((await graph.aget_state(thread)).values.get('analysts'))
+            if pending_feedback is None:
+                # Read in a thread so speculative interviews keep running while the human reads.
+                human_feedback = await asyncio.to_thread(input, "Any additional feedback to guide the analyst generation. Press Enter to continue: ")
+            else:
+                human_feedback = pending_feedback.pop(0) if pending_feedback else None
             human_feedback = human_feedback or None
-            graph.update_state(thread, {"human_analyst_feedback": human_feedback}, as_node='human_feedback')
+            await graph.aupdate_state(thread, {"human_analyst_feedback": human_feedback}, as_node='human_feedback')
             generate_analyst_state = None
 
-        for event in graph.stream(generate_analyst_state, thread, stream_mode="updates"):
+        async for event in graph.astream(generate_analyst_state, thread, stream_mode="updates"):
+            if verbose:
+                print("-" * 50)
+                print(event)
+        if verbose:
             print("-" * 50)
-            print(event)
-        print("-" * 50)
-
-        state_next = graph.get_state(thread).next
-    return graph.get_state(thread).values.get('analysts'), graph.get_state(thread).values.get('topic')
-
-def conduct_research(llm: ChatOpenAI, analysts: list[Analyst], topic: str, max_num_turns: int) -> str:
-    research_state = ResearchState(analysts=analysts, topic=topic)
-    research_agent = ResearchAgent(llm, max_num_turns)
-    thread = {"configurable": {"thread_id": "1"}}
-    graph = research_agent.graph
-    for event in graph.stream(research_state, thread, stream_mode="updates"):
-        print("-" * 50)
-        print(event)
-        print("-" * 50)
-    return graph.get_state(thread).values.get('final_report')
-
-
-def main():
-    llm = ChatOpenAI(model="gpt-5-nano", temperature=0)
-    topic = input("Enter the topic of the research: ")
-    max_analysts = int(input("Enter the number of analysts to generate: "))
-    max_num_turns = int(input("Enter the maximum number of turns for the interview: "))
-    analysts, topic = run_analyst_agent(llm, topic, max_analysts)
-    final_report = conduct_research(llm, analysts, topic, max_num_turns)
-    print(final_report)
+
+        state_next = (await graph.aget_state(thread)).next
+    values = (await graph.aget_state(thread)).values
+    return values.get('analysts'), values.get('topic')
+
+async def conduct_research(
+    llm: ChatOpenAI | ModelRouter,
+    analysts: list[Analyst],
+    topic: str,
+    max_num_turns: int,
+    retrieval_cache: RetrievalCache | None = None,
+    max_concurrency: int = MAX_CONCURRENCY,
+    llm_scheduler: Scheduler | None = None,
+    search_scheduler: Scheduler | None = None,
+    stream: bool = False,
+    output_path: str | None = None,
+    thread_id: str = "1",
+    verbose: bool = True,
+    checkpointer: BaseCheckpointSaver | None = None,
+    document_store: DocumentStore | None = None,
+    tracer: Tracer | None = None,
+    research_agent: ResearchAgent | None = None,
+) -> str:
+    """Run the research graph and return the final report.
+
+    If the thread already has a checkpoint the run continues from it: interviews that
+    finished before the interruption are kept and only the unfinished ones run again.
+    Pass a `research_agent` to reuse interviews it started speculatively.
+    """
+    research_state = ResearchState(analysts=analysts, topic=topic, max_num_turns=max_num_turns)
+    owned = research_agent is None
+    research_agent = research_agent or ResearchAgent(
+        llm,
+        max_num_turns,
+        retrieval_cache,
+        max_concurrency,
+        llm_scheduler,
+        search_scheduler,
+        document_store=document_store,
+        checkpointer=checkpointer,
+    )
+    try:
+        thread = {"configurable": {"thread_id": thread_id}, "callbacks": [tracer] if tracer else []}
+        graph = research_agent.graph
+        snapshot = await graph.aget_state(thread)
+        if snapshot.values:
+            research_state = None
+            # A finished run has nothing left to stream; just read its report back.
+            stream = stream and bool(snapshot.next)
+        if not stream:
+            async for event in graph.astream(research_state, thread, stream_mode="updates"):
+                if verbose:
+                    print("-" * 50)
+                    print(event)
+                    print("-" * 50)
+            final_report = (await graph.aget_state(thread)).values.get('final_report')
+            if output_path and final_report is not None:
+                with open(output_path, "w") as f:
+                    f.write(final_report)
+            return final_report
+
+        streamer = ReportStreamer(research_agent.document_store, output_path)
+        async for mode, event in graph.astream(research_state, thread, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                chunk, metadata = event
+                streamer.on_token(metadata.get("langgraph_node"), chunk.content if isinstance(chunk.content, str) else "")
+            else:
+                for node, update in event.items():
+                    streamer.on_update(node, update)
+        final_report = (await graph.aget_state(thread)).values.get('final_report')
+        streamer.finish(final_report)
+        return final_report
+    finally:
+        # An agent made here is not reused, so its retriever connections can go.
+        if owned:
+            await research_agent.aclose()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Research a topic with a team of AI analysts.")
+    parser.add_argument("--stream", action="store_true", help="Stream the report tokens as they are generated.")
+    parser.add_argument("--output", help="Markdown file to write the report to.")
+    parser.add_argument("--trace", help="JSON file to write a Chrome trace of the run to (opens in Perfetto).")
+    parser.add_argument("--speculate", action="store_true", help="Start interviewing proposed analysts while waiting for feedback.")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Continue an interrupted run from its last checkpoint.")
+    parser.add_argument("--checkpoints", default=DEFAULT_CHECKPOINT_PATH, help="SQLite file for the run checkpoints.")
+    parser.add_argument("--keep-runs", type=int, default=DEFAULT_KEEP_RUNS, help="Most recent runs to keep checkpoints for.")
+    parser.add_argument("--max-age-days", type=float, default=DEFAULT_MAX_AGE_DAYS, help="Drop checkpoints of runs idle for longer.")
+    parser.add_argument("--models", help="JSON file routing graph nodes to models (see README).")
+    parser.add_argument("--incremental-sections", action="store_true", help="Draft each memo during its interview (one more model call per turn).")
+    args = parser.parse_args()
+    llm_cache = LLMCache()
+    llm = build_llm(llm_cache, args.models)
+    retrieval_cache = RetrievalCache()
+    llm_scheduler = Scheduler("llm", LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+    search_scheduler = Scheduler("search", SEARCH_REQUESTS_PER_MINUTE)
+    tracer = Tracer()
+    async with open_checkpointer(args.checkpoints) as checkpointer:
+        registry = RunRegistry(checkpointer)
+        await registry.setup()
+        if args.resume:
+            run = await registry.get(args.resume)
+            if run is None:
+                raise SystemExit(f"No checkpointed run with id {args.resume}")
+            run_id, topic = run["run_id"], run["topic"]
+            max_analysts, max_num_turns = run["max_analysts"], run["max_num_turns"]
+            await registry.set_status(run_id, "running")
+            print(f"Resuming run {run_id}: {topic}")
+        else:
+            topic = input("Enter the topic of the research: ")
+            max_analysts = int(input("Enter the number of analysts to generate: "))
+            max_num_turns = int(input("Enter the maximum number of turns for the interview: "))
+            run_id = await registry.create(topic, max_analysts, max_num_turns)
+            print(f"Run id: {run_id} (continue it with --resume {run_id} if it is interrupted)")
+        pruned = await registry.prune(args.keep_runs, args.max_age_days)
+        if pruned:
+            print(f"Pruned checkpoints of {len(pruned)} old runs")
+
+        research_agent = ResearchAgent(
+            llm,
+            max_num_turns,
+            retrieval_cache,
+            MAX_CONCURRENCY,
+            llm_scheduler,
+            search_scheduler,
+            document_store=DocumentStore(registry.document_store_path(run_id)),
+            checkpointer=checkpointer,
+            incremental_sections=args.incremental_sections,
+        )
+        on_analysts = None
+        if args.speculate:
+            on_analysts = lambda proposed: research_agent.speculate(topic, proposed, [tracer])
+        analysts, topic = await run_analyst_agent(
+            llm,
+            topic,
+            max_analysts,
+            llm_scheduler,
+            thread_id=analyst_thread_id(run_id),
+            checkpointer=checkpointer,
+            tracer=tracer,
+            on_analysts=on_analysts,
+        )
+        try:
+            final_report = await conduct_research(
+                llm,
+                analysts,
+                topic,
+                max_num_turns,
+                stream=args.stream,
+                output_path=args.output,
+                thread_id=research_thread_id(run_id),
+                tracer=tracer,
+                research_agent=research_agent,
+            )
+        finally:
+            research_agent.cancel_speculation()
+            await research_agent.aclose()
+        await registry.set_status(run_id, "completed")
+    if not args.stream:
+        print(final_report)
+    print(f"LLM cache: {llm_cache.stats()}")
+    print(f"Retrieval cache: {retrieval_cache.stats()}")
+    print(f"LLM scheduler: {llm_scheduler.stats()}")
+    print(f"Search scheduler: {search_scheduler.stats()}")
+    if args.speculate:
+        print(f"Speculative interviews: {research_agent.speculation_stats()}")
+    print(tracer.summary())
+    if args.trace:
+        tracer.export(args.trace)
+        print(f"Trace written to {args.trace}")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
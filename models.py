@@ -0,0 +1,111 @@
+import json
+import openai
+from langchain_core.caches import BaseCache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, Field
+
+DEFAULT_MODEL = "gpt-5-nano"
+FALLBACK_MODEL = "gpt-5-mini"
+
+# Errors that make a node move on to its next fallback model instead of failing.
+TIMEOUT_ERRORS = (openai.APITimeoutError, TimeoutError)
+
+
+class ModelRoute(BaseModel):
+    """Model and parameters for one graph node, and the models to try if it times out"""
+    model: str = DEFAULT_MODEL
+    temperature: float | None = 0
+    timeout: float | None = Field(default=60.0, description="Seconds before falling back to the next model.")
+    fallbacks: list[str] = Field(default_factory=lambda: [FALLBACK_MODEL])
+
+
+# Short, low-stakes calls get a tight timeout so a slow request falls back quickly;
+# the writers produce long outputs and get more time.
+DEFAULT_ROUTES: dict[str, ModelRoute] = {
+    "ask_question": ModelRoute(timeout=30.0),
+    "plan_queries": ModelRoute(timeout=30.0),
+    "compact_history": ModelRoute(timeout=30.0),
+    "revise_draft": ModelRoute(timeout=120.0),
+    "write_section": ModelRoute(timeout=180.0),
+    "reduce_sections": ModelRoute(timeout=180.0),
+    "write_report": ModelRoute(timeout=180.0),
+    "write_introduction": ModelRoute(timeout=120.0),
+    "write_conclusion": ModelRoute(timeout=120.0),
+}
+
+
+class ModelRouter:
+    """Chat model for each graph node, with fallbacks on timeout.
+
+    `chat(node)` returns the node's model chained with its fallbacks, and
+    `structured(node, schema)` the same with structured output. Both are built once
+    and reused, so agents can look them up while building their graphs. Nodes without
+    a route of their own use the default model.
+    """
+
+    def __init__(
+        self,
+        default: BaseChatModel,
+        models: dict[str, list[BaseChatModel]] | None = None,
+        fallbacks: list[BaseChatModel] | None = None,
+    ):
+        self.default = default
+        self.models = models or {}
+        self.fallbacks = fallbacks or []
+        self._chat: dict[str, Runnable] = {}
+        self._structured: dict[tuple[str, type], Runnable] = {}
+
+    def _chain(self, node: str) -> list[BaseChatModel]:
+        return self.models.get(node) or [self.default, *self.fallbacks]
+
+    def chat(self, node: str) -> Runnable:
+        if node not in self._chat:
+            primary, *fallbacks = self._chain(node)
+            self._chat[node] = primary.with_fallbacks(fallbacks, exceptions_to_handle=TIMEOUT_ERRORS) if fallbacks else primary
+        return self._chat[node]
+
+    def structured(self, node: str, schema: type[BaseModel]) -> Runnable:
+        key = (node, schema)
+        if key not in self._structured:
+            primary, *fallbacks = [model.with_structured_output(schema) for model in self._chain(node)]
+            self._structured[key] = primary.with_fallbacks(fallbacks, exceptions_to_handle=TIMEOUT_ERRORS) if fallbacks else primary
+        return self._structured[key]
+
+
+def as_router(llm: BaseChatModel | ModelRouter) -> ModelRouter:
+    """Agents accept a single chat model, used for every node, or a router"""
+    return llm if isinstance(llm, ModelRouter) else ModelRouter(llm)
+
+
+def load_routes(path: str) -> tuple[ModelRoute, dict[str, ModelRoute]]:
+    """Read {"default": {...}, "nodes": {"<node>": {...}}} from a JSON file"""
+    with open(path) as f:
+        config = json.load(f)
+    default = ModelRoute(**config.get("default", {}))
+    return default, {node: ModelRoute(**route) for node, route in config.get("nodes", {}).items()}
+
+
+def build_router(
+    cache: BaseCache | None = None,
+    default: ModelRoute | None = None,
+    routes: dict[str, ModelRoute] | None = None,
+) -> ModelRouter:
+    """Create the ChatOpenAI clients for the routes, sharing one per distinct configuration"""
+    default = default or ModelRoute()
+    routes = DEFAULT_ROUTES if routes is None else routes
+    clients: dict[tuple, ChatOpenAI] = {}
+
+    def client(model: str, route: ModelRoute) -> ChatOpenAI:
+        key = (model, route.temperature, route.timeout)
+        if key not in clients:
+            # Retries are handled by the scheduler so they respect the shared budgets.
+            clients[key] = ChatOpenAI(model=model, temperature=route.temperature, timeout=route.timeout, cache=cache, max_retries=0)
+        return clients[key]
+
+    def chain(route: ModelRoute) -> list[BaseChatModel]:
+        return [client(model, route) for model in [route.model, *route.fallbacks]]
+
+    primary, *fallbacks = chain(default)
+    return ModelRouter(primary, {node: chain(route) for node, route in routes.items()}, fallbacks)
@@ -0,0 +1,121 @@
+import re
+import numpy as np
+from collections import Counter
+from scheduler import CHARS_PER_TOKEN
+from documents import SourceDocument
+
+CHUNK_CHARS = 800
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS) -> list[str]:
+    """Greedily pack paragraphs into chunks of about `chunk_chars`, splitting long ones on words"""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > chunk_chars:
+            cut = paragraph.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut])
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 1 > chunk_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class PassageIndex:
+    """BM25 index over the passages of an interview's retrieved documents.
+
+    Documents are chunked into passages that keep a pointer to their source document.
+    Term frequencies are kept as per-term postings, so the index grows with the text
+    rather than passages x vocabulary, and a query only touches its own terms.
+    """
+
+    def __init__(self, documents: list[SourceDocument], chunk_chars: int = CHUNK_CHARS):
+        self.documents = documents
+        self.passages: list[tuple[int, str]] = []
+        for doc_index, document in enumerate(documents):
+            for chunk in chunk_text(document.content, chunk_chars):
+                self.passages.append((doc_index, chunk))
+
+        postings: dict[str, tuple[list[int], list[int]]] = {}
+        lengths = []
+        for row, (_, passage) in enumerate(self.passages):
+            tokens = tokenize(passage)
+            lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                rows, counts = postings.setdefault(token, ([], []))
+                rows.append(row)
+                counts.append(count)
+        # term -> (passage rows containing it, its frequency in each of them)
+        self.postings: dict[str, tuple[np.ndarray, np.ndarray]] = {
+            token: (np.array(rows, dtype=np.intp), np.array(counts, dtype=np.float32))
+            for token, (rows, counts) in postings.items()
+        }
+        self.lengths = np.array(lengths, dtype=np.float32)
+        self.average_length = float(self.lengths.mean()) if len(self.passages) else 0.0
+
+    def idf(self, token: str) -> float:
+        n = len(self.passages)
+        document_frequency = len(self.postings[token][0])
+        return float(np.log(1 + (n - document_frequency + 0.5) / (document_frequency + 0.5)))
+
+    def score(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        terms = [token for token in set(tokenize(query)) if token in self.postings]
+        if not terms:
+            return scores
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / max(self.average_length, 1.0))
+        for token in terms:
+            rows, tf = self.postings[token]
+            scores[rows] += self.idf(token) * tf * (BM25_K1 + 1) / (tf + norm[rows])
+        return scores
+
+    def select(self, query: str, max_tokens: int, top_k: int) -> list[tuple[int, str]]:
+        """Highest scoring passages for `query`, up to `top_k` of them within `max_tokens`"""
+        scores = self.score(query)
+        # Stable sort keeps retrieval order among equally scored (e.g. unmatched) passages.
+        ranked = np.argsort(-scores, kind="stable")
+        selected = []
+        budget = max_tokens * CHARS_PER_TOKEN
+        for index in ranked[:top_k]:
+            doc_index, passage = self.passages[index]
+            if len(passage) > budget:
+                continue
+            budget -= len(passage)
+            selected.append((int(index), doc_index, passage))
+        selected.sort()
+        return [(doc_index, passage) for _, doc_index, passage in selected]
+
+    def format(self, selected: list[tuple[int, str]]) -> str:
+        """Group selected passages under their source document tags"""
+        grouped: dict[int, list[str]] = {}
+        for doc_index, passage in selected:
+            grouped.setdefault(doc_index, []).append(passage)
+        return "\n\n---\n\n".join([
+            f"<Document {self.documents[doc_index].attributes()}/>\n" + "\n...\n".join(passages) + "\n</Document>"
+            for doc_index, passages in grouped.items()
+        ])
+
+
+def select_context(documents: list[SourceDocument], query: str, max_tokens: int, top_k: int) -> str:
+    """Format the passages of `documents` most relevant to `query` within a token budget"""
+    index = PassageIndex(documents)
+    return index.format(index.select(query, max_tokens, top_k))
@@ -1,152 +1,281 @@
+import asyncio
+import uuid
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import HumanMessage, SystemMessage
-from schemas import ResearchState
+from schemas import Analyst, ResearchState, InterviewState
 from interview import InterviewAgent
 from langgraph.types import Send
+from cache import RetrievalCache
+from scheduler import Scheduler
+from documents import DocumentStore
+from retrievers import Retriever
+from models import ModelRouter, as_router
 from schemas import ResearchState
 
-REPORT_WRITER_INSTRUCTIONS = """You are a technical writer creating a report on this overall topic:
-{topic}
+# The report, introduction and conclusion calls all start with the same system message
+# (shared rules, then the run's topic and memos) and differ only in the instructions
+# that follow it, so the provider can cache their common prompt prefix.
+
+SYNTHESIS_INSTRUCTIONS = """You are a technical writer creating a report on an overall topic.
 
 You have a team of analysts. Each analyst has done two things:
 
 1. They conducted an interview with an expert on a specific sub-topic.
 2. The write up their finding into a memo.
 
-Your task:
-1. You will be given a collection of memos from your analysts
-2. Think carefully about the insights from each memo.
-3. Consolidate these into a crisp, overall summary that ties together the central ideas from all the memos.
-4. Summarize the central points in each memo into a cohesive single narrative.
+You will be asked to write one part of the report from their memos: the body, the introduction or the conclusion.
 
-To format your report:
+For every part:
 
 1. Use markdown formatting.
-2. Include no pre-amble for the report.
-3. Use no sub-heading.
-4. Start your report with a single title header: # Insights
-5. Do not mention any analyst names in your report.
-6. Preserve any citations in the memos, with will be annotated in brackes, for example [1] or [2].
-7. Create a final, consolidated list of sources and add to a Sources section with the `## Sources` header.
-8. List your sources in order and do not repeat. Make sure to include the source number in the list.
-For example:
-[1] Source 1
-[2] Source 2
-
-Here are the memos from your analysts to build your report from:
-
-{context}
+2. Include no pre-amble.
+3. Do not mention any analyst names.
+4. Preserve any citations in the memos exactly as written. They are document ids in brackets, for example [d3f9a1c2].
+5. Do not add a Sources section. Sources are numbered and listed automatically from the cited document ids.
+
+Topic: {topic}
+
+Memos:
+
+{memos}
 """
 
-INTRO_CONCLUSION_INSTRUCTIONS = """You are a technical writer finishing a report on a {topic}
-You will be given all of the sections of the report.
+REPORT_INSTRUCTIONS = """Write the body of the report.
 
-Your job is to write a crisp and compelling introduction or conclusion section.
+1. Think carefully about the insights from each memo.
+2. Consolidate these into a crisp, overall summary that ties together the central ideas from all the memos.
+3. Summarize the central points in each memo into a cohesive single narrative.
+4. Use no sub-heading.
+5. Start your report with a single title header: # Insights
+"""
 
-The user will intruct you whether to write the introduction or conclusion.
+INTRODUCTION_INSTRUCTIONS = """Write the introduction of the report.
 
-Include no pre-amble for either section.
+Target around 100 words, crisply previewing all of the sections of the report.
 
-Target around 100 words, crisply previewing (for introduction) or recapping (for conclusion) all of the sections of the report.
+Create a compelling title and use the # header for the title, then use ## Introduction as the section header.
+"""
 
-Use markdown formatting.
+CONCLUSION_INSTRUCTIONS = """Write the conclusion of the report.
 
-For your introduction, create a compelling title and use the # header for the title.
+Target around 100 words, crisply recapping all of the sections of the report.
 
-For your introduction, use ## Introduction as the section header.
+Use ## Conclusion as the section header.
+"""
+
+REDUCE_INSTRUCTIONS = """You are a technical writer condensing memos written by a team of analysts.
 
-For your conclusion, use ## Conclusion as the section header.
+You will be given the topic followed by a batch of memos.
 
-Here are the sections to reflect on for writing: {context}
+Your task:
+1. Merge the memos into a single memo that keeps every distinct, specific insight.
+2. Drop repetition and generalities, keeping concrete examples and figures.
+3. Keep the memo under {max_words} words.
+4. Preserve citations exactly as written. They are document ids in brackets, for example [d3f9a1c2].
+5. Use markdown with a ## title. Include no pre-amble.
 """
 
+# Interviews allowed to run at once; the rest of the initiate_interview fan-out waits
+# for a free slot.
+MAX_CONCURRENCY = 8
+
+# Report writing only starts once every interview is done, so it never competes with
+# them; it still outranks anything a concurrent run may have queued.
+SYNTHESIS_PRIORITY = 1_000
+
+# Memos are condensed in batches of this many until no more than this many remain, so
+# the report prompts stay bounded however many analysts ran. None disables reduction.
+SYNTHESIS_FAN_IN = 4
+REDUCED_MEMO_WORDS = 600
+
+
+def synthesis_messages(topic: str, memos: list[str], instructions: str) -> list[SystemMessage | HumanMessage]:
+    """The shared system message with the topic and memos, then the call's own instructions"""
+    system_message = SystemMessage(content=SYNTHESIS_INSTRUCTIONS.format(topic=topic, memos="\n\n".join(memos)))
+    return [system_message, HumanMessage(content=instructions)]
+
+
 class ResearchAgent:
-    def __init__(self, llm: ChatOpenAI, max_num_turns: int = 5):
+    def __init__(
+        self,
+        llm: ChatOpenAI | ModelRouter,
+        max_num_turns: int = 5,
+        retrieval_cache: RetrievalCache | None = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        llm_scheduler: Scheduler | None = None,
+        search_scheduler: Scheduler | None = None,
+        document_store: DocumentStore | None = None,
+        synthesis_fan_in: int | None = SYNTHESIS_FAN_IN,
+        checkpointer: BaseCheckpointSaver | None = None,
+        retrievers: list[Retriever] | None = None,
+        incremental_sections: bool = False,
+    ):
         self.llm = llm
-        self.graph = self._build_graph()
+        self.models = as_router(llm)
+        self.retrievers = retrievers
+        self.checkpointer = checkpointer or MemorySaver()
+        if synthesis_fan_in is not None and synthesis_fan_in < 2:
+            # Batches of one never shrink the memo count, so the reduction would not end.
+            raise ValueError(f"synthesis_fan_in must be None or at least 2, got {synthesis_fan_in}")
+        self.synthesis_fan_in = synthesis_fan_in
+        self.document_store = document_store or DocumentStore()
+        self.retrieval_cache = retrieval_cache
+        self.llm_scheduler = llm_scheduler or Scheduler("llm")
+        self.search_scheduler = search_scheduler
         self.max_num_turns = max_num_turns
+        self.max_concurrency = max_concurrency
+        self.interview_agent = InterviewAgent(
+            self.models,
+            self.retrieval_cache,
+            self.retrievers,
+            llm_scheduler=self.llm_scheduler,
+            search_scheduler=self.search_scheduler,
+            document_store=self.document_store,
+            incremental_sections=incremental_sections,
+        )
+        self.interview_slots = asyncio.Semaphore(self.max_concurrency)
+        # Interviews started before the analysts were confirmed, by analyst.
+        self._speculative: dict[str, asyncio.Task] = {}
+        self.speculated = 0
+        self.speculation_reused = 0
+        self.speculation_cancelled = 0
+        self.graph = self._build_graph()
+
+    def interview_input(self, topic: str, analyst: Analyst, max_num_turns: int | None = None) -> dict:
+        return {
+            "analyst": analyst,
+            "max_num_turns": max_num_turns or self.max_num_turns,
+            "interview_id": uuid.uuid4().hex,
+            "messages": [HumanMessage(content=f"So you said you were wring an article on {topic}?")]
+        }
+
+    async def run_interview(self, interview_input: dict, config: dict | None = None) -> list[str]:
+        """Run one analyst interview once a concurrency slot is free and return its sections"""
+        async with self.interview_slots:
+            try:
+                interview = await self.interview_agent.graph.ainvoke(interview_input, config)
+            finally:
+                self.interview_agent.discard(interview_input["interview_id"])
+        return interview["sections"]
+
+    def speculate(self, topic: str, analysts: list[Analyst], callbacks: list | None = None):
+        """Start interviewing proposed analysts before they are confirmed.
+
+        Interviews of analysts no longer proposed are cancelled; those of analysts that
+        are still proposed keep running and are picked up by `conduct_interview`.
+        """
+        proposed = {analyst.model_dump_json(): analyst for analyst in analysts}
+        for key in list(self._speculative):
+            if key not in proposed:
+                self._speculative.pop(key).cancel()
+                self.speculation_cancelled += 1
+        for key, analyst in proposed.items():
+            if key not in self._speculative:
+                config = {"callbacks": callbacks or [], "metadata": {"analyst": analyst.name}}
+                self._speculative[key] = asyncio.create_task(self.run_interview(self.interview_input(topic, analyst), config))
+                self.speculated += 1
+
+    def cancel_speculation(self):
+        for task in self._speculative.values():
+            task.cancel()
+        self.speculation_cancelled += len(self._speculative)
+        self._speculative.clear()
+
+    async def aclose(self):
+        """Close the connections held by the interview agent's retrievers"""
+        await self.interview_agent.aclose()
+
+    def speculation_stats(self) -> dict:
+        return {"started": self.speculated, "reused": self.speculation_reused, "cancelled": self.speculation_cancelled}
 
     def _build_graph(self):
+        reduce_llm = self.models.chat("reduce_sections")
+        report_llm = self.models.chat("write_report")
+        introduction_llm = self.models.chat("write_introduction")
+        conclusion_llm = self.models.chat("write_conclusion")
+
         def initiate_interview(state: ResearchState):
             """Start the interview"""
             interviews = []
             for analyst in state.analysts:
-                topic = state.topic
-                interviews.append(Send("conduct_interview", {
-                    "analyst": analyst,
-                    "max_num_turns": self.max_num_turns,
-                    "messages": [HumanMessage(content=f"So you said you were wring an article on {topic}?")]
-                }))
+                interviews.append(Send("conduct_interview", self.interview_input(state.topic, analyst, state.max_num_turns)))
             if len(interviews) == 0:
                 return END
             return interviews
 
-        def write_report(state: ResearchState):
+        async def reduce_memos(topic: str, memos: list[str]) -> str:
+            if len(memos) == 1:
+                return memos[0]
+            system_message = SystemMessage(content=REDUCE_INSTRUCTIONS.format(max_words=REDUCED_MEMO_WORDS))
+            formatted_memos = "\n\n".join(memos)
+            human_msg = HumanMessage(content=f"Topic: {topic}\n\nMemos:\n\n{formatted_memos}")
+            reduced = await self.llm_scheduler.ainvoke(reduce_llm, [system_message, human_msg], priority=SYNTHESIS_PRIORITY)
+            return reduced.content
+
+        async def reduce_sections(state: ResearchState):
+            """Condense the sections in batches until at most synthesis_fan_in remain"""
+            summaries = list(state.sections)
+            fan_in = self.synthesis_fan_in
+            while fan_in is not None and len(summaries) > fan_in:
+                batches = [summaries[i:i + fan_in] for i in range(0, len(summaries), fan_in)]
+                summaries = await asyncio.gather(*[reduce_memos(state.topic, batch) for batch in batches])
+            return {"summaries": summaries}
+
+        async def write_report(state: ResearchState):
             """Write the report"""
-            sections = state.sections
-            topic = state.topic
-            formatted_str_sections = "\n\n".join([section for section in sections])
-            system_message = SystemMessage(content=REPORT_WRITER_INSTRUCTIONS.format(topic=topic, context=formatted_str_sections))
-            human_msg = HumanMessage(content="Write a report based upon these memos.")
-            report = self.llm.invoke([system_message, human_msg])
+            messages = synthesis_messages(state.topic, state.summaries, REPORT_INSTRUCTIONS)
+            report = await self.llm_scheduler.ainvoke(report_llm, messages, priority=SYNTHESIS_PRIORITY)
             return {"content": report.content}
 
-        def write_introduction(state: ResearchState):
+        async def write_introduction(state: ResearchState):
             """Write the introduction"""
-            sections = state.sections
-            topic = state.topic
-            formatted_str_sections = "\n\n".join([section for section in sections])
-            system_message = SystemMessage(content=INTRO_CONCLUSION_INSTRUCTIONS.format(topic=topic, context=formatted_str_sections))
-            human_msg = HumanMessage(content="Write an introduction based upon these sections.")
-            introduction = self.llm.invoke([system_message, human_msg])
+            messages = synthesis_messages(state.topic, state.summaries, INTRODUCTION_INSTRUCTIONS)
+            introduction = await self.llm_scheduler.ainvoke(introduction_llm, messages, priority=SYNTHESIS_PRIORITY)
             return {"introduction": introduction.content}
 
-        def write_conclusion(state: ResearchState):
+        async def write_conclusion(state: ResearchState):
             """Write the conclusion"""
-            sections = state.sections
-            topic = state.topic
-            formatted_str_sections = "\n\n".join([section for section in sections])
-            system_message = SystemMessage(content=INTRO_CONCLUSION_INSTRUCTIONS.format(topic=topic, context=formatted_str_sections))
-            human_msg = HumanMessage(content="Write a conclusion based upon these sections.")
-            conclusion = self.llm.invoke([system_message, human_msg])
+            messages = synthesis_messages(state.topic, state.summaries, CONCLUSION_INSTRUCTIONS)
+            conclusion = await self.llm_scheduler.ainvoke(conclusion_llm, messages, priority=SYNTHESIS_PRIORITY)
             return {"conclusion": conclusion.content}
 
-        def finalize_report(state: ResearchState):
+        async def finalize_report(state: ResearchState):
             """Finalize the report"""
-            content = state.content
-            if content.startswith("## Insights"):
-                content = content.strip("## Insights")
-            if "## Sources" in content:
-                try:
-                    content, sources = content.split("\n## Sources\n")
-                except:
-                    sources = None
-            else:
-                sources = None
-
-            final_report = state.introduction + "\n\n" + content + "\n\n" + state.conclusion
-            if sources is not None:
-                final_report += "\n\n## Sources\n" + sources
+            content = state.content.strip().removeprefix("## Insights")
+            final_report = state.introduction + "\n\n" + content.strip() + "\n\n" + state.conclusion
+            final_report = self.document_store.number_citations(final_report)
             return {"final_report": final_report}
 
+        async def conduct_interview(state: InterviewState):
+            """Run one analyst interview, or take over the one already started speculatively"""
+            interview_input = dict(state)
+            speculative = self._speculative.pop(interview_input["analyst"].model_dump_json(), None)
+            if speculative is not None:
+                self.speculation_reused += 1
+                return {"sections": await speculative}
+            # Tagging the run with the analyst lets the tracer attribute its cost.
+            config = {"metadata": {"analyst": interview_input["analyst"].name}}
+            return {"sections": await self.run_interview(interview_input, config)}
+
         def build_researcher_graph():
             """Build the research graph"""
             builder = StateGraph(ResearchState)
-            interview_agent = InterviewAgent(self.llm)
-            builder.add_node("conduct_interview", interview_agent.graph)
+            builder.add_node("conduct_interview", conduct_interview)
+            builder.add_node("reduce_sections", reduce_sections)
             builder.add_node("write_report", write_report)
             builder.add_node("write_introduction", write_introduction)
             builder.add_node("write_conclusion", write_conclusion)
             builder.add_node("finalize_report", finalize_report)
 
             builder.add_conditional_edges(START, initiate_interview, ["conduct_interview", END])
-            builder.add_edge("conduct_interview", "write_report")
-            builder.add_edge("conduct_interview", "write_introduction")
-            builder.add_edge("conduct_interview", "write_conclusion")
+            builder.add_edge("conduct_interview", "reduce_sections")
+            builder.add_edge("reduce_sections", "write_report")
+            builder.add_edge("reduce_sections", "write_introduction")
+            builder.add_edge("reduce_sections", "write_conclusion")
             builder.add_edge(["write_report", "write_introduction", "write_conclusion"], "finalize_report")
             builder.add_edge("finalize_report", END)
-            memory = MemorySaver()
-            return builder.compile(checkpointer=memory)
+            return builder.compile(checkpointer=self.checkpointer)
         return build_researcher_graph()
\ No newline at end of file
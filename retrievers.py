@@ -0,0 +1,255 @@
+import asyncio
+import os
+import re
+import threading
+import aiohttp
+import httpx
+import numpy as np
+from langchain_tavily import TavilySearch
+from cache import RetrievalCache
+from scheduler import Scheduler
+from documents import SourceDocument
+from corpus import CorpusIndex, DEFAULT_CORPUS_DIR
+from passages import PassageIndex
+
+MAX_RESULTS = 3
+DEFAULT_TIMEOUT = 10.0
+
+# TavilySearch reports HTTP failures as "Error <status>: <reason>".
+TAVILY_STATUS = re.compile(r"^Error (\d{3})\b")
+
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+WIKIPEDIA_USER_AGENT = "research-assistant/0.1 (python-httpx)"
+WIKIPEDIA_CONNECTIONS = 8
+# Characters of passages one Wikipedia search contributes, over at most this many sections.
+WIKIPEDIA_MAX_CHARS = 6000
+WIKIPEDIA_MAX_SECTIONS = 4
+# Sections with no prose of their own.
+SKIPPED_SECTIONS = {"see also", "references", "notes", "external links", "further reading", "bibliography", "sources", "citations"}
+SECTION_HEADING = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.MULTILINE)
+
+
+class SearchError(Exception):
+    """A search backend failed; `status_code` is the HTTP status when there was one"""
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def split_sections(text: str) -> list[tuple[str, str]]:
+    """(section, text) pairs of a plain-text Wikipedia extract; the lead section is unnamed"""
+    headings = list(SECTION_HEADING.finditer(text))
+    sections = [("", text[:headings[0].start()] if headings else text)]
+    for heading, following in zip(headings, [*headings[1:], None]):
+        sections.append((heading.group(2), text[heading.end():following.start() if following else len(text)]))
+    return [(name, body.strip()) for name, body in sections if body.strip() and name.casefold() not in SKIPPED_SECTIONS]
+
+
+class Retriever:
+    """A search backend the interview fans queries out to.
+
+    Subclasses implement `afetch`, or `fetch` for a blocking backend, which then runs in
+    a thread (returning JSON-serializable dicts so results can be cached), and
+    `to_document`. `timeout` bounds how long the interview waits for this
+    retriever before answering with whatever the others returned; `max_results` caps
+    how many documents it contributes per query. `local` retrievers are cheap enough
+    to skip the retrieval cache and the search scheduler. Results are cached under
+    `cache_source` (the name by default); change it when the shape of the results
+    changes, so entries cached before are not served.
+    """
+
+    name: str = ""
+    cache_source: str = ""
+    local: bool = False
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_results: int = MAX_RESULTS):
+        self.timeout = timeout
+        self.max_results = max_results
+
+    def fetch(self, query: str) -> list[dict]:
+        raise NotImplementedError
+
+    async def afetch(self, query: str) -> list[dict]:
+        return await asyncio.to_thread(self.fetch, query)
+
+    def to_document(self, doc: dict) -> SourceDocument:
+        raise NotImplementedError
+
+    async def aclose(self):
+        """Release the connections the retriever holds"""
+
+    async def asearch(self, query: str, cache: RetrievalCache | None = None, scheduler: Scheduler | None = None, priority: int = 0) -> list[dict]:
+        """Async search; only cache misses go through the scheduler's rate limits"""
+        def fetch():
+            if scheduler is None:
+                return self.afetch(query)
+            return scheduler.run(lambda: self.afetch(query), priority)
+
+        if self.local:
+            docs = await self.afetch(query)
+        elif cache is None:
+            docs = await fetch()
+        else:
+            docs = await cache.aget_or_fetch(self.cache_source or self.name, query, fetch)
+        return docs[:self.max_results]
+
+
+class TavilyRetriever(Retriever):
+    name = "tavily"
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_results: int = MAX_RESULTS):
+        super().__init__(timeout, max_results)
+        self.client = TavilySearch(max_results=max_results)
+
+    async def afetch(self, query: str) -> list[dict]:
+        return self._parse(await self.client.ainvoke({"query": query}))
+
+    def _parse(self, data) -> list[dict]:
+        if not isinstance(data, dict):
+            return []
+        # TavilySearch returns failures instead of raising them; raise them again so the
+        # scheduler can retry throttling and transient errors.
+        if (error := data.get("error")) is not None:
+            if isinstance(error, (aiohttp.ClientConnectionError, TimeoutError)):
+                raise ConnectionError(f"Tavily: {error}") from error
+            match = TAVILY_STATUS.match(str(error))
+            raise SearchError(f"Tavily: {error}", int(match.group(1)) if match else None) from error
+        return [{"url": doc.get("url"), "content": doc.get("content")} for doc in data.get("results", [])]
+
+    def to_document(self, doc: dict) -> SourceDocument:
+        return SourceDocument(source=doc.get("url") or "", content=doc.get("content") or "", is_link=True)
+
+
+class WikipediaRetriever(Retriever):
+    """Searches Wikipedia and returns only the article passages most relevant to the query.
+
+    Candidate pages are fetched concurrently over a pooled HTTP client and split by
+    section. Passages from all pages are ranked together with BM25 and kept up to
+    `max_chars`; each result is one section, linked by its URL anchor so citations
+    point at the section the passages came from.
+    """
+
+    name = "wikipedia"
+    # Whole articles were cached under "wikipedia"; these results are capped passages.
+    cache_source = "wikipedia-passages"
+
+    def __init__(
+        self,
+        timeout: float = 15.0,
+        max_results: int = WIKIPEDIA_MAX_SECTIONS,
+        pages: int = MAX_RESULTS,
+        max_chars: int = WIKIPEDIA_MAX_CHARS,
+        api_url: str = WIKIPEDIA_API_URL,
+    ):
+        super().__init__(timeout, max_results)
+        self.pages = pages
+        self.max_chars = max_chars
+        self.api_url = api_url
+        self._client: httpx.AsyncClient | None = None
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            headers={"User-Agent": WIKIPEDIA_USER_AGENT},
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=WIKIPEDIA_CONNECTIONS, max_keepalive_connections=WIKIPEDIA_CONNECTIONS),
+        )
+
+    async def _get(self, client: httpx.AsyncClient, **params) -> dict:
+        response = await client.get(self.api_url, params={"action": "query", "format": "json", "formatversion": "2", **params})
+        response.raise_for_status()
+        return response.json().get("query", {})
+
+    async def _page(self, client: httpx.AsyncClient, title: str) -> dict:
+        # Full plain-text extracts come back one page per request, hence the concurrent fetches.
+        data = await self._get(client, prop="extracts|info", inprop="url", explaintext="1", exsectionformat="wiki", redirects="1", titles=title)
+        pages = data.get("pages") or [{}]
+        return pages[0]
+
+    async def _fetch(self, client: httpx.AsyncClient, query: str) -> list[dict]:
+        found = await self._get(client, list="search", srsearch=query, srlimit=self.pages, srprop="")
+        titles = [result["title"] for result in found.get("search", [])]
+        pages = await asyncio.gather(*[self._page(client, title) for title in titles])
+        return self._passages(query, [page for page in pages if page.get("extract") and page.get("fullurl")])
+
+    async def afetch(self, query: str) -> list[dict]:
+        if self._client is None:
+            self._client = self._new_client()
+        return await self._fetch(self._client, query)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _passages(self, query: str, pages: list[dict]) -> list[dict]:
+        """The best passages within `max_chars`, grouped by section in order of their best passage"""
+        sections = [
+            SourceDocument(source=page["fullurl"] + (f"#{section.replace(' ', '_')}" if section else ""), page=section, content=text, is_link=True)
+            for page in pages
+            for section, text in split_sections(page["extract"])
+        ]
+        index = PassageIndex(sections)
+        scores = index.score(query)
+        chosen: dict[int, list[int]] = {}
+        budget = self.max_chars
+        for position in np.argsort(-scores, kind="stable"):
+            # Passages sharing no term with the query are not worth their prompt tokens.
+            if scores[position] <= 0:
+                break
+            section, passage = index.passages[position]
+            if len(passage) > budget or (section not in chosen and len(chosen) >= self.max_results):
+                continue
+            budget -= len(passage)
+            chosen.setdefault(section, []).append(int(position))
+        return [
+            {
+                "source": sections[section].source,
+                "page": sections[section].page,
+                "content": "\n...\n".join(index.passages[position][1] for position in sorted(positions)),
+            }
+            for section, positions in chosen.items()
+        ]
+
+    def to_document(self, doc: dict) -> SourceDocument:
+        return SourceDocument(source=doc.get("source") or "", page=str(doc.get("page") or ""), content=doc.get("content") or "", is_link=True)
+
+
+class LocalCorpusRetriever(Retriever):
+    """Searches a local directory of PDF, markdown and text files (CORPUS_DIR, default ./corpus)"""
+
+    name = "local"
+    local = True
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_results: int = MAX_RESULTS, root: str = DEFAULT_CORPUS_DIR, index: CorpusIndex | None = None):
+        super().__init__(timeout, max_results)
+        self.index = index or CorpusIndex(root)
+        self._refreshed = False
+        self._refresh_lock = threading.Lock()
+
+    def fetch(self, query: str) -> list[dict]:
+        with self._refresh_lock:
+            if not self._refreshed:
+                self.index.refresh()
+                self._refreshed = True
+        return self.index.search(query, self.max_results)
+
+    def to_document(self, doc: dict) -> SourceDocument:
+        return SourceDocument(source=doc["source"], page=doc["page"], content=doc["content"])
+
+
+RETRIEVERS: dict[str, type[Retriever]] = {
+    TavilyRetriever.name: TavilyRetriever,
+    WikipediaRetriever.name: WikipediaRetriever,
+    LocalCorpusRetriever.name: LocalCorpusRetriever,
+}
+
+
+def default_retriever_names() -> list[str]:
+    """Every registered retriever, with `local` only when there is a corpus directory to search"""
+    return [name for name in RETRIEVERS if name != LocalCorpusRetriever.name or os.path.isdir(DEFAULT_CORPUS_DIR)]
+
+
+def build_retrievers(names: list[str] | None = None) -> list[Retriever]:
+    """Instantiate retrievers from the registry by name, defaulting to `default_retriever_names()`"""
+    return [RETRIEVERS[name]() for name in (names or default_retriever_names())]
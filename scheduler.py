@@ -0,0 +1,248 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, TypeVar
+
+import openai
+from langchain_core.messages import BaseMessage
+from tracing import emit, SCHEDULER_EVENT
+
+T = TypeVar("T")
+
+# Rough characters-per-token ratio used to size a request before it is sent, plus the
+# completion allowance reserved on top of the prompt.
+CHARS_PER_TOKEN = 4
+COMPLETION_TOKENS_ESTIMATE = 1000
+
+MAX_RETRIES = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    ConnectionError,
+)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(messages: list[BaseMessage]) -> int:
+    """Cheap upper-ish bound on the tokens a chat call will consume"""
+    chars = sum(len(str(message.content)) for message in messages)
+    return chars // CHARS_PER_TOKEN + COMPLETION_TOKENS_ESTIMATE
+
+
+def _status_code(error: BaseException) -> int | None:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Seconds the server asked us to wait, from Retry-After / retry-after-ms headers"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    if (value := headers.get("retry-after-ms")) is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    if (value := headers.get("retry-after")) is not None:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS) or _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Continuously refilling budget of `per_minute` units"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.available = min(self.capacity, self.available + min(amount, self.capacity))
+
+
+class Scheduler:
+    """Shared gate for calls to one upstream API.
+
+    Enforces requests-per-minute and tokens-per-minute budgets, admits waiting calls
+    highest priority first (interview nodes pass how far along their interview is, so
+    running interviews drain before new ones start), and retries throttled or transient
+    failures with jittered exponential backoff that honors Retry-After.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = MAX_RETRIES,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._waiters: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition = asyncio.Condition()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens))
+        return delay
+
+    async def _acquire(self, priority: int, tokens: int) -> float:
+        started = time.monotonic()
+        entry = (-priority, next(self._sequence))
+        async with self._condition:
+            heapq.heappush(self._waiters, entry)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+            self._condition.notify_all()
+            try:
+                while True:
+                    if self._waiters[0] != entry:
+                        await self._condition.wait()
+                        continue
+                    delay = self._delay(tokens)
+                    if delay <= 0:
+                        break
+                    # Sleep until the budget refills, but wake early if a higher
+                    # priority call arrives and should go first.
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), delay)
+                    except TimeoutError:
+                        pass
+            except BaseException:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waiters)
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None:
+                self.tokens.consume(tokens)
+            self._condition.notify_all()
+        waited = time.monotonic() - started
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            delay = max(delay, server_delay)
+        return delay
+
+    async def run(self, call: Callable[[], Awaitable[T]], priority: int = 0, tokens: int = 0) -> T:
+        """Run `call` once the budgets allow it, retrying transient failures"""
+        attempt = 0
+        while True:
+            waited = await self._acquire(priority, tokens)
+            self.calls += 1
+            await emit(SCHEDULER_EVENT, {"scheduler": self.name, "wait": waited, "attempt": attempt})
+            try:
+                result = await call()
+            except Exception as e:
+                if _status_code(e) == 429 or isinstance(e, openai.RateLimitError):
+                    self.throttled += 1
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.failures += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self.retries += 1
+                print(f"{self.name}: {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                continue
+            self._reconcile(tokens, result)
+            return result
+
+    def _reconcile(self, estimated: int, result: Any):
+        """Charge the token budget for what the call actually used rather than the estimate"""
+        usage = getattr(result, "usage_metadata", None)
+        if not usage:
+            return
+        # LangChain zeroes total_cost on responses served from the LLM cache; those never
+        # reached the API, so they give back the request and tokens they were admitted with.
+        if usage.get("total_cost") == 0:
+            if self.requests is not None:
+                self.requests.refund(1)
+            if self.tokens is not None:
+                self.tokens.refund(estimated)
+            return
+        if self.tokens is not None:
+            self.tokens.available -= usage.get("total_tokens", estimated) - min(estimated, self.tokens.capacity)
+
+    async def ainvoke(self, runnable, messages: list[BaseMessage], priority: int = 0):
+        """Schedule `runnable.ainvoke(messages)`, sized by an estimate of its tokens"""
+        return await self.run(lambda: runnable.ainvoke(messages), priority, estimate_tokens(messages))
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_wait": round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+            "max_wait": round(self.max_wait, 3),
+        }
@@ -27,22 +27,33 @@ class GeneratAnalystState(Perspective):
 
 class InterviewState(BaseModel):
     max_num_turns: int
-    context: Annotated[list, operator.add] = Field(default_factory=list)
+    context: Annotated[list[str], operator.add] = Field(default_factory=list, description="Ids of the retrieved documents in the DocumentStore.")
     analyst: Analyst
     interview: str = ""
     sections: list = Field(default_factory=list)
     messages: Annotated[list[AnyMessage], add_messages] = Field(default_factory=list)
+    search_queries: list[str] = Field(default_factory=list)
+    new_context: list[str] = Field(default_factory=list, description="Ids of the documents the last retrieval added to context.")
+    num_responses: int = Field(default=0, description="Expert answers given so far.")
+    document_novelty: float = Field(default=1.0, description="Share of the last retrieval's documents not seen before in this interview.")
+    novelty: float = Field(default=1.0, description="How much new content the last turn added, from 0 to 1.")
+    seen_shingles: set[int] = Field(default_factory=set, description="Shingle hashes of the answers given so far.")
+    interview_id: str = Field(default="", description="Key of the interview's compacted messages and memo draft, kept outside the state.")
+    summary: str = Field(default="", description="Running summary of the turns compacted out of messages.")
+    compacted_messages: int = Field(default=0, description="Messages moved out of messages into the summary.")
 
 
-class SearchQuestion(BaseModel):
-    search_query: str = Field(description="The search query to use to find relevant documents.")
+class SearchQueries(BaseModel):
+    search_queries: list[str] = Field(description="One to three distinct search queries to use to find relevant documents.")
 
 
 class ResearchState(Perspective):
     sections: Annotated[list, operator.add] = Field(default_factory=list)
+    summaries: list[str] = Field(default_factory=list, description="The sections condensed to at most the synthesis fan-in.")
     introduction: str = ""
     content: str = ""
     conclusion: str = ""
     final_report: str = ""
     topic: str = ""
+    max_num_turns: int | None = Field(default=None, description="Interview turns for this run; the agent's default when unset.")
     messages: Annotated[list[AnyMessage], add_messages] = Field(default_factory=list)
\ No newline at end of file
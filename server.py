@@ -0,0 +1,428 @@
+import argparse
+import asyncio
+import json
+import time
+import traceback
+from typing import AsyncIterator
+from uuid import UUID
+from aiohttp import web
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from pydantic import BaseModel, Field, ValidationError
+from analyst import AnalystAgent
+from batch import DEFAULT_MAX_ANALYSTS, DEFAULT_MAX_NUM_TURNS, DEFAULT_WORKERS
+from cache import LLMCache, RetrievalCache
+from checkpoints import (
+    RunRegistry,
+    open_checkpointer,
+    analyst_thread_id,
+    research_thread_id,
+    DEFAULT_CHECKPOINT_PATH,
+    DEFAULT_KEEP_RUNS,
+    DEFAULT_MAX_AGE_DAYS,
+    DEFAULT_RUNS_DIR,
+)
+from documents import DocumentStore
+from main import (
+    build_llm,
+    run_analyst_agent,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    SEARCH_REQUESTS_PER_MINUTE,
+)
+from models import ModelRouter
+from research import ResearchAgent, MAX_CONCURRENCY
+from retrievers import Retriever
+from scheduler import Scheduler
+from schemas import ResearchState
+from tracing import analyst_name
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+# Seconds between comments sent on an idle event stream so proxies keep it open.
+KEEPALIVE_SECONDS = 15
+FINISHED_STATUSES = {"completed", "failed", "cancelled"}
+
+
+class JobRequest(BaseModel):
+    topic: str = Field(min_length=1)
+    max_analysts: int = Field(default=DEFAULT_MAX_ANALYSTS, ge=1)
+    max_num_turns: int = Field(default=DEFAULT_MAX_NUM_TURNS, ge=1)
+    feedback: list[str] = Field(default_factory=list, description="Applied one entry per analyst regeneration pass.")
+
+
+class Job:
+    """A research job and the progress events published while it runs.
+
+    Events are kept so a client that subscribes late, or reconnects with
+    `Last-Event-ID`, first gets everything it missed.
+    """
+
+    def __init__(self, job_id: str, request: JobRequest):
+        self.id = job_id
+        self.request = request
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.report: str | None = None
+        self.error: str | None = None
+        self.task: asyncio.Task | None = None
+        self.events: list[dict] = []
+        self._subscribers: set[asyncio.Queue] = set()
+
+    def publish(self, event: str, data: dict):
+        entry = {"id": len(self.events), "event": event, "data": data}
+        self.events.append(entry)
+        for queue in self._subscribers:
+            queue.put_nowait(entry)
+
+    def set_status(self, status: str, **data):
+        self.status = status
+        if status == "running":
+            self.started_at = time.time()
+        elif status in FINISHED_STATUSES:
+            self.finished_at = time.time()
+        self.publish("status", {"status": status, **data})
+
+    async def subscribe(self, after: int = -1) -> AsyncIterator[dict | None]:
+        """Events after the given id, then new ones until the job finishes; None while idle"""
+        queue = asyncio.Queue()
+        # A negative id would otherwise slice from the end and replay the wrong events.
+        missed = self.events[max(after, -1) + 1:]
+        self._subscribers.add(queue)
+        try:
+            for entry in missed:
+                yield entry
+            if self.status in FINISHED_STATUSES:
+                return
+            while True:
+                try:
+                    entry = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except TimeoutError:
+                    yield None
+                    continue
+                yield entry
+                if entry["event"] == "status" and entry["data"]["status"] in FINISHED_STATUSES:
+                    return
+        finally:
+            self._subscribers.discard(queue)
+
+    def to_dict(self, report: bool = False) -> dict:
+        values = {
+            "job_id": self.id,
+            "topic": self.request.topic,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if report:
+            values["report"] = self.report
+        return values
+
+
+class ProgressReporter(BaseCallbackHandler):
+    """Publishes a job event each time a graph node finishes"""
+
+    run_inline = True
+
+    def __init__(self, job: Job):
+        self.job = job
+        self._open: dict[UUID, dict] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, metadata: dict | None = None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if not node or kwargs.get("name") != node or node.startswith("__"):
+            return
+        self._open[run_id] = {"node": node, "analyst": analyst_name(metadata, inputs)}
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        if (node := self._open.pop(run_id, None)) is not None:
+            self.job.publish("node", node)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._open.pop(run_id, None)
+
+
+class ResearchService:
+    """Runs queued research jobs on a fixed pool of workers.
+
+    The analyst graph, the model clients, caches and schedulers are built once and shared
+    by every job; jobs are kept apart by their thread ids in the checkpointer. Each job
+    gets its own research agent over a document store at its run's path, so the store
+    goes away when the run is pruned instead of growing for the life of the service.
+    Pass a fake chat model and `retrievers` to run it offline.
+    """
+
+    def __init__(
+        self,
+        llm: ChatOpenAI | ModelRouter,
+        checkpointer: AsyncSqliteSaver,
+        workers: int = DEFAULT_WORKERS,
+        max_concurrency: int = MAX_CONCURRENCY,
+        retrieval_cache: RetrievalCache | None = None,
+        llm_scheduler: Scheduler | None = None,
+        search_scheduler: Scheduler | None = None,
+        retrievers: list[Retriever] | None = None,
+        runs_dir: str = DEFAULT_RUNS_DIR,
+        keep_jobs: int = DEFAULT_KEEP_RUNS,
+    ):
+        self.llm = llm
+        self.checkpointer = checkpointer
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.retrieval_cache = retrieval_cache or RetrievalCache()
+        self.llm_scheduler = llm_scheduler or Scheduler("llm")
+        self.search_scheduler = search_scheduler or Scheduler("search")
+        self.retrievers = retrievers
+        self.registry = RunRegistry(checkpointer, runs_dir)
+        self.keep_jobs = keep_jobs
+        self.jobs: dict[str, Job] = {}
+        self.queue: asyncio.Queue[Job] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self.analyst_agent: AnalystAgent | None = None
+
+    async def start(self, keep_runs: int = DEFAULT_KEEP_RUNS, max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        await self.registry.setup()
+        pruned = await self.registry.prune(keep_runs, max_age_days)
+        if pruned:
+            print(f"Pruned checkpoints of {len(pruned)} old runs")
+        self.analyst_agent = AnalystAgent(self.llm, self.llm_scheduler, self.checkpointer)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def research_agent(self, job: Job) -> ResearchAgent:
+        """The research graph for one job, over the job's own document store"""
+        return ResearchAgent(
+            self.llm,
+            DEFAULT_MAX_NUM_TURNS,
+            self.retrieval_cache,
+            self.max_concurrency,
+            self.llm_scheduler,
+            self.search_scheduler,
+            document_store=DocumentStore(self.registry.document_store_path(job.id)),
+            checkpointer=self.checkpointer,
+            retrievers=self.retrievers,
+        )
+
+    async def close(self):
+        """Stop the workers and cancel the jobs that are still running"""
+        for worker in self._workers:
+            worker.cancel()
+        running = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*self._workers, *running, return_exceptions=True)
+
+    async def submit(self, request: JobRequest) -> Job:
+        job_id = await self.registry.create(request.topic, request.max_analysts, request.max_num_turns)
+        await self.registry.set_status(job_id, "queued")
+        job = Job(job_id, request)
+        self.jobs[job_id] = job
+        job.set_status("queued")
+        self.queue.put_nowait(job)
+        return job
+
+    async def cancel(self, job: Job) -> bool:
+        """Cancel a queued or running job; False if it had already finished"""
+        if job.status in FINISHED_STATUSES:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Not picked up yet; the worker skips it when it comes off the queue.
+            await self._finish(job, "cancelled")
+        return True
+
+    async def _finish(self, job: Job, status: str, **data):
+        job.set_status(status, **data)
+        await self.registry.set_status(job.id, status)
+        finished = sorted(
+            (other for other in self.jobs.values() if other.status in FINISHED_STATUSES),
+            key=lambda other: other.finished_at,
+        )
+        # Older finished jobs are forgotten here; their status stays in the registry.
+        for other in finished[:max(len(finished) - self.keep_jobs, 0)]:
+            del self.jobs[other.id]
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status != "queued":
+                    continue
+                job.task = asyncio.create_task(self._run(job))
+                # Waits without raising when the job alone is cancelled.
+                await asyncio.wait([job.task])
+                if job.status not in FINISHED_STATUSES:
+                    # Cancelled before it got to run.
+                    await self._finish(job, "cancelled")
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: Job):
+        request = job.request
+        research_agent = None
+        try:
+            research_agent = self.research_agent(job)
+            job.set_status("running")
+            await self.registry.set_status(job.id, "running")
+            analysts, topic = await run_analyst_agent(
+                self.llm,
+                request.topic,
+                request.max_analysts,
+                self.llm_scheduler,
+                feedback=request.feedback,
+                thread_id=analyst_thread_id(job.id),
+                verbose=False,
+                checkpointer=self.checkpointer,
+                analyst_agent=self.analyst_agent,
+            )
+            job.publish("analysts", {"analysts": [analyst.model_dump() for analyst in analysts]})
+            graph = research_agent.graph
+            config = {"configurable": {"thread_id": research_thread_id(job.id)}, "callbacks": [ProgressReporter(job)]}
+            research_state = ResearchState(analysts=analysts, topic=topic, max_num_turns=request.max_num_turns)
+            async for event in graph.astream(research_state, config, stream_mode="updates"):
+                for node, update in event.items():
+                    if node == "conduct_interview" and update:
+                        for section in update.get("sections", []):
+                            job.publish("section", {"content": research_agent.document_store.number_citations(section)})
+            job.report = (await graph.aget_state(config)).values.get("final_report")
+            if not job.report:
+                raise RuntimeError("the research graph finished without a report")
+        except asyncio.CancelledError:
+            await self._finish(job, "cancelled")
+            raise
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            await self._finish(job, "failed", error=job.error)
+        else:
+            await self._finish(job, "completed")
+        finally:
+            if research_agent is not None:
+                await research_agent.aclose()
+
+
+def create_app(service: ResearchService) -> web.Application:
+    """HTTP API over the service:
+
+    POST /jobs                  queue a job, body {"topic", "max_analysts"?, "max_num_turns"?, "feedback"?}
+    GET  /jobs                  status of every job the service remembers
+    GET  /jobs/{job_id}         status of one job, with its report once completed
+    GET  /jobs/{job_id}/events  Server-Sent Events: status, analysts, node and section
+    POST /jobs/{job_id}/cancel  cancel a queued or running job
+    """
+    routes = web.RouteTableDef()
+
+    def find_job(request: web.Request) -> Job:
+        job = service.jobs.get(request.match_info["job_id"])
+        if job is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "unknown job"}), content_type="application/json")
+        return job
+
+    @routes.post("/jobs")
+    async def submit(request: web.Request) -> web.Response:
+        try:
+            job_request = JobRequest.model_validate(await request.json())
+        except (ValueError, ValidationError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        job = await service.submit(job_request)
+        return web.json_response(job.to_dict(), status=202)
+
+    @routes.get("/jobs")
+    async def list_jobs(request: web.Request) -> web.Response:
+        return web.json_response([job.to_dict() for job in service.jobs.values()])
+
+    @routes.get("/jobs/{job_id}")
+    async def status(request: web.Request) -> web.Response:
+        job_id = request.match_info["job_id"]
+        if job_id not in service.jobs and (run := await service.registry.get(job_id)) is not None:
+            # Finished long enough ago to be forgotten; only the registry still knows it.
+            return web.json_response({"job_id": job_id, "topic": run["topic"], "status": run["status"]})
+        return web.json_response(find_job(request).to_dict(report=True))
+
+    @routes.post("/jobs/{job_id}/cancel")
+    async def cancel(request: web.Request) -> web.Response:
+        job = find_job(request)
+        if not await service.cancel(job):
+            return web.json_response({"error": f"job already {job.status}"}, status=409)
+        return web.json_response(job.to_dict())
+
+    @routes.get("/jobs/{job_id}/events")
+    async def events(request: web.Request) -> web.StreamResponse:
+        job = find_job(request)
+        try:
+            after = int(request.headers.get("Last-Event-ID", -1))
+        except ValueError:
+            return web.json_response({"error": "Last-Event-ID must be an event id"}, status=400)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        async for entry in job.subscribe(after):
+            if entry is None:
+                await response.write(b": keepalive\n\n")
+            else:
+                await response.write(f"id: {entry['id']}\nevent: {entry['event']}\ndata: {json.dumps(entry['data'])}\n\n".encode("utf-8"))
+        return response
+
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+
+async def serve(args: argparse.Namespace):
+    llm_cache = LLMCache()
+    retrieval_cache = RetrievalCache()
+    llm_scheduler = Scheduler("llm", LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+    search_scheduler = Scheduler("search", SEARCH_REQUESTS_PER_MINUTE)
+    async with open_checkpointer(args.checkpoints) as checkpointer:
+        service = ResearchService(
+            build_llm(llm_cache, args.models),
+            checkpointer,
+            workers=args.workers,
+            max_concurrency=args.max_concurrency,
+            retrieval_cache=retrieval_cache,
+            llm_scheduler=llm_scheduler,
+            search_scheduler=search_scheduler,
+        )
+        await service.start(args.keep_runs, args.max_age_days)
+        runner = web.AppRunner(create_app(service))
+        await runner.setup()
+        await web.TCPSite(runner, args.host, args.port).start()
+        print(f"Serving research jobs on http://{args.host}:{args.port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            await service.close()
+            print(f"LLM cache: {llm_cache.stats()}")
+            print(f"Retrieval cache: {retrieval_cache.stats()}")
+            print(f"LLM scheduler: {llm_scheduler.stats()}")
+            print(f"Search scheduler: {search_scheduler.stats()}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve research jobs over a local HTTP API.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Jobs researched at the same time.")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY, help="Interviews run at once across all jobs.")
+    parser.add_argument("--checkpoints", default=DEFAULT_CHECKPOINT_PATH, help="SQLite file for the run checkpoints.")
+    parser.add_argument("--keep-runs", type=int, default=DEFAULT_KEEP_RUNS, help="Most recent runs to keep checkpoints for.")
+    parser.add_argument("--max-age-days", type=float, default=DEFAULT_MAX_AGE_DAYS, help="Drop checkpoints of runs idle for longer.")
+    parser.add_argument("--models", help="JSON file routing graph nodes to models (see README).")
+    return parser.parse_args(argv)
+
+
+def main():
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
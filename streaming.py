@@ -0,0 +1,119 @@
+import os
+import re
+import sys
+from documents import CitationNumberer, DocumentStore
+
+# Report pieces in final order, with the state field each node writes.
+REPORT_NODES = {
+    "write_introduction": "introduction",
+    "write_report": "content",
+    "write_conclusion": "conclusion",
+}
+# A "[" with no closing "]" within this many characters is not a citation being streamed.
+MAX_CITATION_CHARS = 64
+UNCLOSED_BRACKET = re.compile(r"\[[^\]]*$")
+
+
+class ReportStreamer:
+    """Streams the report to stdout and a markdown file as it is generated.
+
+    The introduction, report body and conclusion are written concurrently, so tokens
+    of the piece currently being emitted go straight out while the others are buffered
+    and flushed, in final order, as soon as the pieces before them finish. Citations are
+    numbered on the fly the same way `finalize_report` numbers them, and the file is
+    rewritten with the finalized report at the end. Each analyst memo is appended to
+    `<output>.memos.md` as soon as its interview completes.
+    """
+
+    def __init__(self, document_store: DocumentStore, output_path: str | None = None, out=sys.stdout):
+        self.document_store = document_store
+        self.output_path = output_path
+        self.out = out
+        self.numberer = CitationNumberer(document_store)
+        self.order = list(REPORT_NODES)
+        self.position = 0
+        self.buffers = {node: "" for node in self.order}
+        self.received = {node: False for node in self.order}
+        self.finished = {node: False for node in self.order}
+        self.pending = ""
+        self.file = None
+        self.memos_file = None
+        if output_path:
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            self.file = open(output_path, "w")
+            self.memos_file = open(f"{os.path.splitext(output_path)[0]}.memos.md", "w")
+
+    def _write(self, text: str, final: bool = False):
+        """Emit text, holding back a possibly incomplete citation until it closes"""
+        text = self.pending + text
+        self.pending = ""
+        match = UNCLOSED_BRACKET.search(text)
+        if not final and match and len(match.group()) < MAX_CITATION_CHARS:
+            self.pending = match.group()
+            text = text[:match.start()]
+        if not text:
+            return
+        text = self.numberer.renumber(text)
+        self.out.write(text)
+        self.out.flush()
+        if self.file:
+            self.file.write(text)
+            self.file.flush()
+
+    def _flush_pending(self):
+        self._write("", final=True)
+
+    def _advance(self):
+        """Move on past finished pieces, flushing what the next ones buffered meanwhile"""
+        while self.position < len(self.order) and self.finished[self.order[self.position]]:
+            self._flush_pending()
+            self._write("\n\n")
+            self.position += 1
+            if self.position < len(self.order):
+                node = self.order[self.position]
+                buffered, self.buffers[node] = self.buffers[node], ""
+                self._write(buffered)
+
+    def on_token(self, node: str, text: str):
+        if node not in self.buffers or not text:
+            return
+        self.received[node] = True
+        if self.position < len(self.order) and self.order[self.position] == node:
+            self._write(text)
+        else:
+            self.buffers[node] += text
+
+    def on_update(self, node: str, update: dict | None):
+        if node == "conduct_interview" and update:
+            for section in update.get("sections", []):
+                self.on_memo(section)
+        if node not in self.finished:
+            return
+        if not self.received[node] and update:
+            # Nothing was streamed (e.g. a cache hit), so emit the finished text whole.
+            self.on_token(node, update.get(REPORT_NODES[node], ""))
+        self.finished[node] = True
+        self._advance()
+
+    def on_memo(self, memo: str):
+        memo = self.document_store.number_citations(memo)
+        print("-" * 50, file=self.out)
+        print(memo, file=self.out)
+        print("-" * 50, file=self.out)
+        if self.memos_file:
+            self.memos_file.write(memo + "\n\n---\n\n")
+            self.memos_file.flush()
+
+    def finish(self, final_report: str | None):
+        """Close the streams and replace the streamed file with the finalized report"""
+        self._flush_pending()
+        sources = self.numberer.sources() if self.numberer.numbers else ""
+        if sources:
+            self.out.write(f"\n\n{sources}\n")
+        if self.file:
+            self.file.close()
+            if final_report is not None:
+                with open(self.output_path, "w") as f:
+                    f.write(final_report)
+        if self.memos_file:
+            self.memos_file.close()
@@ -0,0 +1,81 @@
+import hashlib
+import unittest
+from documents import CitationNumberer, DocumentStore, SourceDocument
+
+ARTICLE = (
+    "Grid-scale batteries store surplus solar power during the day and release it in the evening peak, "
+    "which lets utilities retire gas peaker plants and smooth the ramp as the sun sets over the network. "
+    "Operators also bid the same batteries into frequency regulation markets, where a fast response earns "
+    "a premium over slower thermal units, and stack that revenue with capacity payments. Degradation limits "
+    "how many full cycles a lithium iron phosphate pack can deliver, so owners schedule charging around "
+    "price spreads rather than cycling every day."
+)
+
+
+def link(url: str, content: str) -> SourceDocument:
+    return SourceDocument(source=url, content=content, is_link=True)
+
+
+class DocumentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = DocumentStore()
+
+    def test_same_page_through_tracking_links(self):
+        first = self.store.add(link("https://www.example.com/storage/?utm_source=feed", "Batteries firm up solar."))
+        second = self.store.add(link("http://example.com/storage", "Costs fell by 90% since 2010."))
+        self.assertEqual(first, second)
+        # Both snippets of the page are kept.
+        self.assertIn("Costs fell", self.store.get(first).content)
+        self.assertEqual(self.store.duplicates, 1)
+
+    def test_same_content_under_another_source(self):
+        first = self.store.add(link("https://a.example/article", ARTICLE))
+        second = self.store.add(link("https://mirror.example/copy", "  " + ARTICLE.upper()))
+        self.assertEqual(first, second)
+
+    def test_near_duplicate_content(self):
+        first = self.store.add(link("https://a.example/article", ARTICLE))
+        second = self.store.add(link("https://b.example/syndicated", ARTICLE.replace("every day", "daily")))
+        self.assertEqual(first, second)
+        self.assertEqual(self.store.stats(), {"documents": 1, "duplicates": 1})
+
+    def test_ids_are_stable_across_stores(self):
+        document = link("https://a.example/article", ARTICLE)
+        self.assertEqual(self.store.add(document), DocumentStore().add(document))
+
+    def test_colliding_id_is_lengthened(self):
+        key = "https://a.example/article#"
+        taken = "d" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:7]
+        self.store._index(SourceDocument(id=taken, source="https://other.example", content="Unrelated text."))
+        id = self.store.add(link("https://a.example/article", ARTICLE))
+        self.assertNotEqual(id, taken)
+        self.assertTrue(id.startswith(taken))
+        self.assertEqual(self.store.get(taken).source, "https://other.example")
+        self.assertEqual(self.store.number_citations(f"Claim [{id}]."), "Claim [1].\n\n## Sources\n\n[1] https://a.example/article")
+
+
+class CitationNumberingTest(unittest.TestCase):
+    def setUp(self):
+        self.store = DocumentStore()
+        self.a = self.store.add(link("https://a.example", "Pumped hydro dominates installed storage."))
+        self.b = self.store.add(SourceDocument(source="report.pdf", page="7", content="Lithium prices fell in 2023."))
+
+    def test_numbers_follow_first_citation(self):
+        text = f"Hydro [{self.a}]. Lithium [{self.b}; {self.a}]. Again [{self.b}].\n\n## Sources\n\nwritten by the model"
+        self.assertEqual(
+            self.store.number_citations(text),
+            "Hydro [1]. Lithium [2], [1]. Again [2].\n\n## Sources\n\n[1] https://a.example\n\n[2] report.pdf, page 7",
+        )
+
+    def test_unknown_ids_are_dropped(self):
+        self.assertEqual(self.store.number_citations(f"Claim [d0000000, {self.b}]."), "Claim [1].\n\n## Sources\n\n[1] report.pdf, page 7")
+
+    def test_pieces_number_like_the_whole_text(self):
+        pieces = [f"First [{self.b}] ", f"then [{self.a}] ", f"and [{self.b}]."]
+        numberer = CitationNumberer(self.store)
+        self.assertEqual("".join(numberer.renumber(piece) for piece in pieces), "First [1] then [2] and [1].")
+        self.assertEqual(numberer.numbers, {self.b: 1, self.a: 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
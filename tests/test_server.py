@@ -0,0 +1,83 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from aiohttp.test_utils import TestClient, TestServer
+from benchmark import FakeChatModel, FakeRetriever
+from cache import RetrievalCache
+from checkpoints import open_checkpointer
+from server import ResearchService, create_app
+
+
+def parse_events(text: str) -> list[tuple[int, str]]:
+    """(id, event) pairs of a Server-Sent Events body"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            events.append((int(fields["id"]), fields["event"]))
+    return events
+
+
+class ResearchServiceTest(unittest.IsolatedAsyncioTestCase):
+    """Runs the service end to end offline, against the benchmark's fake model and retriever"""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.checkpointer = await self.enterAsyncContext(open_checkpointer(os.path.join(self.directory.name, "checkpoints.sqlite")))
+        self.service = ResearchService(
+            FakeChatModel(latency=0.01, completion_tokens=50),
+            self.checkpointer,
+            workers=1,
+            retrieval_cache=RetrievalCache(":memory:"),
+            retrievers=[FakeRetriever(latency=0.01, document_chars=500)],
+            runs_dir=self.directory.name,
+        )
+        await self.service.start()
+        self.addAsyncCleanup(self.service.close)
+        self.client = await self.enterAsyncContext(TestClient(TestServer(create_app(self.service))))
+        # The analyst graph prints the personas it creates.
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+
+    async def test_job_lifecycle(self):
+        response = await self.client.post("/jobs", json={"topic": "Grid-scale batteries", "max_analysts": 2, "max_num_turns": 1})
+        self.assertEqual(response.status, 202)
+        job_id = (await response.json())["job_id"]
+
+        # With one worker busy on the first job, the second one is still queued.
+        response = await self.client.post("/jobs", json={"topic": "Pumped hydro"})
+        queued_id = (await response.json())["job_id"]
+        response = await self.client.post(f"/jobs/{queued_id}/cancel")
+        self.assertEqual(response.status, 200)
+        self.assertEqual((await response.json())["status"], "cancelled")
+
+        response = await self.client.get(f"/jobs/{job_id}/events")
+        events = parse_events(await response.text())
+        names = [event for _, event in events]
+        self.assertEqual(names[0], "status")
+        self.assertIn("analysts", names)
+        self.assertIn("node", names)
+        self.assertEqual(names.count("section"), 2)
+        self.assertEqual(names[-1], "status")
+
+        status = await (await self.client.get(f"/jobs/{job_id}")).json()
+        self.assertEqual(status["status"], "completed")
+        self.assertTrue(status["report"])
+        self.assertTrue(os.path.exists(self.service.registry.document_store_path(job_id)))
+
+        # A reconnecting client only gets the events after the last one it saw.
+        last_seen = events[-3][0]
+        response = await self.client.get(f"/jobs/{job_id}/events", headers={"Last-Event-ID": str(last_seen)})
+        self.assertEqual(parse_events(await response.text()), events[-2:])
+
+        response = await self.client.get(f"/jobs/{job_id}/events", headers={"Last-Event-ID": "latest"})
+        self.assertEqual(response.status, 400)
+
+        response = await self.client.post("/jobs", json={"max_analysts": 2})
+        self.assertEqual(response.status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
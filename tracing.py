@@ -0,0 +1,202 @@
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Any
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langchain_core.outputs import LLMResult
+
+# USD per million input and output tokens.
+MODEL_PRICES = {
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5": (1.25, 10.00),
+}
+MAIN_TRACK = "main"
+
+SCHEDULER_EVENT = "scheduler"
+RETRIEVAL_EVENT = "retrieval"
+
+
+async def emit(name: str, data: dict):
+    """Report a measurement to the tracer of the enclosing graph run, if there is one"""
+    try:
+        await adispatch_custom_event(name, data)
+    except RuntimeError:
+        # Not running inside a runnable, so there is nobody to report to.
+        pass
+
+
+def estimate_cost(model: str | None, prompt_tokens: int, completion_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model or "", (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def analyst_name(metadata: dict, inputs: Any) -> str | None:
+    """The analyst a graph run belongs to, from its metadata or its input state"""
+    if metadata.get("analyst"):
+        return metadata["analyst"]
+    analyst = inputs.get("analyst") if isinstance(inputs, dict) else getattr(inputs, "analyst", None)
+    return getattr(analyst, "name", None)
+
+
+class Tracer(BaseCallbackHandler):
+    """Callback handler recording where a run spends time, tokens and money.
+
+    Every graph node execution and chat model call becomes a span on the track of
+    the analyst it belongs to (or the main track), and the scheduler and retrieve
+    node report queue waits, retries and retrieved bytes as custom events. Totals
+    are kept per node and per analyst for `summary`, and `export` writes the spans
+    in Chrome trace-event format for chrome://tracing or Perfetto.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events: list[dict] = []
+        self.nodes: dict[str, Counter] = defaultdict(Counter)
+        self.analysts: dict[str, Counter] = defaultdict(Counter)
+        self._analyst_spans: dict[str, list[float]] = {}
+        self._open: dict[UUID, dict] = {}
+        self._tracks: dict[str, int] = {MAIN_TRACK: 0}
+
+    def _now(self) -> float:
+        return time.perf_counter() - self.started
+
+    def _track(self, analyst: str | None) -> int:
+        return self._tracks.setdefault(analyst or MAIN_TRACK, len(self._tracks))
+
+    def _add(self, node: str | None, analyst: str | None, **values: float):
+        if node:
+            self.nodes[node].update(values)
+        if analyst:
+            self.analysts[analyst].update(values)
+
+    def _span(self, name: str, category: str, start: float, end: float, analyst: str | None, args: dict | None = None):
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round(start * 1e6),
+            "dur": round((end - start) * 1e6),
+            "pid": 1,
+            "tid": self._track(analyst),
+            "args": args or {},
+        })
+        if analyst:
+            first, last = self._analyst_spans.get(analyst, (start, end))
+            self._analyst_spans[analyst] = [min(first, start), max(last, end)]
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, metadata: dict | None = None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        # Only the node runnable itself; not routers, runnables nested inside it or
+        # LangGraph's own __start__ node.
+        if not node or kwargs.get("name") != node or node.startswith("__"):
+            return
+        self._open[run_id] = {"node": node, "analyst": analyst_name(metadata, inputs), "start": self._now()}
+
+    def _end_node(self, run_id: UUID, error: BaseException | None = None):
+        span = self._open.pop(run_id, None)
+        if span is None or "model" in span:
+            return
+        end = self._now()
+        self._span(span["node"], "node", span["start"], end, span["analyst"], {"error": repr(error)} if error else None)
+        self._add(span["node"], None, calls=1, wall=end - span["start"])
+        if span["analyst"]:
+            self.analysts[span["analyst"]]["calls"] += 1
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        self._end_node(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._end_node(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: dict | None = None, **kwargs):
+        metadata = metadata or {}
+        self._open[run_id] = {
+            "node": metadata.get("langgraph_node"),
+            "analyst": metadata.get("analyst"),
+            "model": metadata.get("ls_model_name"),
+            "start": self._now(),
+        }
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        span = self._open.pop(run_id, None)
+        if span is None:
+            return
+        end = self._now()
+        usage = {}
+        if response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            usage = getattr(message, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens", 0)
+        completion_tokens = usage.get("output_tokens", 0)
+        # LangChain zeroes total_cost on responses served from the LLM cache.
+        cached = usage.get("total_cost") == 0
+        cost = 0.0 if cached else estimate_cost(span["model"], prompt_tokens, completion_tokens)
+        self._span(span["model"] or "llm", "llm", span["start"], end, span["analyst"], {
+            "node": span["node"],
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+            "cached": cached,
+        })
+        self._add(
+            span["node"],
+            span["analyst"],
+            llm_calls=1,
+            cached=int(cached),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=cost,
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._open.pop(run_id, None)
+
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID, metadata: dict | None = None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        analyst = metadata.get("analyst")
+        if name == SCHEDULER_EVENT:
+            end = self._now()
+            if data["wait"] > 0:
+                self._span(f"queue:{data['scheduler']}", "queue", end - data["wait"], end, analyst, {"node": node})
+            self._add(node, analyst, queue_wait=data["wait"], retries=int(data["attempt"] > 0))
+        elif name == RETRIEVAL_EVENT:
+            self._add(node, analyst, retrieved_bytes=data["bytes"], retrieved_documents=data["documents"])
+
+    def export(self, path: str):
+        """Write the spans as a Chrome trace-event JSON file"""
+        names = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track}}
+            for track, tid in self._tracks.items()
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": names + self.events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self) -> str:
+        """Per-node and per-analyst totals as fixed-width tables"""
+        header = f"{'':<24}{'calls':>7}{'wall s':>10}{'queue s':>10}{'llm':>6}{'cached':>8}{'prompt':>10}{'compl.':>9}{'cost $':>10}{'retries':>9}{'KB':>9}"
+
+        def row(name: str, stats: Counter, wall: float) -> str:
+            return (
+                f"{name[:23]:<24}{stats['calls']:>7}{wall:>10.2f}{stats['queue_wait']:>10.2f}{stats['llm_calls']:>6}{stats['cached']:>8}"
+                f"{stats['prompt_tokens']:>10}{stats['completion_tokens']:>9}{stats['cost']:>10.4f}{stats['retries']:>9}"
+                f"{stats['retrieved_bytes'] / 1024:>9.1f}"
+            )
+
+        lines = ["Nodes", header]
+        for node, stats in sorted(self.nodes.items(), key=lambda item: -item[1]["wall"]):
+            lines.append(row(node, stats, stats["wall"]))
+        if self.analysts:
+            lines += ["", "Analysts", header]
+            for analyst, stats in sorted(self.analysts.items()):
+                first, last = self._analyst_spans.get(analyst, (0.0, 0.0))
+                lines.append(row(analyst, stats, last - first))
+        total = sum(self.nodes.values(), Counter())
+        lines += ["", f"Total: {self._now():.2f}s, {total['prompt_tokens']} prompt + {total['completion_tokens']} completion tokens, ${total['cost']:.4f}"]
+        return "\n".join(lines)
@@ -0,0 +1,23 @@
+import threading
+from langchain_core.messages import AnyMessage
+
+
+class TranscriptStore:
+    """Holds the messages compacted out of interview state, so full transcripts can be rebuilt.
+
+    Graph state keeps only the running summary and the most recent turns; the messages
+    summarized away are appended here under the interview's id, in order.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._messages: dict[str, list[AnyMessage]] = {}
+
+    def append(self, interview_id: str, messages: list[AnyMessage]):
+        with self._lock:
+            self._messages.setdefault(interview_id, []).extend(messages)
+
+    def pop(self, interview_id: str) -> list[AnyMessage]:
+        """The interview's compacted messages, forgetting them"""
+        with self._lock:
+            return self._messages.pop(interview_id, [])